@@ -0,0 +1,144 @@
+import asyncio
+import collections
+import log
+from typing import Any,Awaitable,Callable,Dict,Hashable
+
+logger = log.getLogger('actor')
+
+'''
+The queue and worker for a single key in the ActorQueue
+'''
+class _actor():
+    def __init__(self, maxDepth:int):
+        self.queue   = asyncio.Queue(maxsize=maxDepth)
+        self.task    = None
+
+        # Jobs held back while the queue is full, in the order they were submitted, with the
+        # future their submitter is waiting on until the job is moved into the queue
+        self.held: 'collections.deque[tuple]' = collections.deque()
+
+'''
+Runs jobs one at a time, in the order they were submitted, for each key. Jobs for different keys
+run in parallel.
+
+Each key gets its own bounded queue. When a queue is full, submitting waits until there is room,
+which pushes back on whoever is producing the jobs. Held back jobs are moved into the queue in the
+order they were submitted, and anything submitted while jobs are held back lines up behind them
+even if there is room by then, so the order is kept under backpressure. The worker for a key only
+exists while its queue has jobs in it, so idle keys don't cost anything.
+
+The following are kept for monitoring:
+processed - Total number of jobs run
+failed    - Total number of jobs that raised an exception
+blocked   - Total number of submits that had to wait for room in a queue
+lagMax    - The longest time a job has waited in a queue before running, in seconds
+lagAvg    - A moving average of the time jobs wait in a queue before running, in seconds
+'''
+class ActorQueue():
+    # Weight of the latest job in the lag moving average
+    LAG_ALPHA = 0.1
+
+    def __init__(self, maxDepth:int=100):
+        self.maxDepth = maxDepth
+        self.actors: Dict[Hashable, _actor] = {}
+
+        self.processed = 0
+        self.failed    = 0
+        self.blocked   = 0
+        self.lagMax    = 0.0
+        self.lagAvg    = 0.0
+
+    '''
+    Queues a job for the key. The job should be a function that takes no arguments and returns an
+    awaitable. This returns once the job is queued, not when it has run
+    '''
+    async def submit(self, key:Hashable, job:Callable[[], Awaitable[Any]]):
+        act = self.actors.get(key)
+        if act is None:
+            act = _actor(self.maxDepth)
+            self.actors[key] = act
+
+        loop = asyncio.get_running_loop()
+        item = (loop.time(), job)
+        if act.queue.full() or (len(act.held) > 0):
+            # The worker moves this into the queue once everything ahead of it has room
+            self.blocked += 1
+            entry = (item, loop.create_future())
+            act.held.append(entry)
+            try:
+                await entry[1]
+            except asyncio.CancelledError:
+                # Drop the job if it didn't make it into the queue
+                if entry in act.held:
+                    act.held.remove(entry)
+                raise
+        else:
+            act.queue.put_nowait(item)
+
+        if act.task is None:
+            act.task = loop.create_task(self._run(key, act))
+
+    '''
+    Number of jobs waiting for the key
+    '''
+    def depth(self, key:Hashable) -> int:
+        act = self.actors.get(key)
+        if act is None:
+            return 0
+
+        return act.queue.qsize()
+
+    '''
+    A summary of the queues for monitoring
+    '''
+    def stats(self) -> Dict[str, Any]:
+        depths = [a.queue.qsize() for a in self.actors.values()]
+
+        return {
+            'actors':    len(depths),
+            'depth':     sum(depths),
+            'depthMax':  max(depths, default=0),
+            'processed': self.processed,
+            'failed':    self.failed,
+            'blocked':   self.blocked,
+            'lagAvg':    self.lagAvg,
+            'lagMax':    self.lagMax,
+        }
+
+    async def _run(self, key:Hashable, act:_actor):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while not act.queue.empty():
+                queued,job = act.queue.get_nowait()
+                self._release(act)
+
+                lag = loop.time() - queued
+                self.lagMax = max(self.lagMax, lag)
+                self.lagAvg += self.LAG_ALPHA * (lag - self.lagAvg)
+
+                try:
+                    await job()
+                except Exception:
+                    self.failed += 1
+                    logger.exception('Job for %s failed', key)
+
+                self.processed += 1
+        finally:
+            # Nothing left to do, so stop until something else is submitted
+            # Keep the queue around if something is still waiting to put a job in it
+            act.task = None
+            if (self.actors.get(key) is act) and act.queue.empty() and (len(act.held) == 0):
+                self.actors.pop(key)
+
+    '''
+    Moves the oldest held back job into the queue now that there is room, and lets its submitter go
+    '''
+    def _release(self, act:_actor):
+        while (len(act.held) > 0) and not act.queue.full():
+            item,fut = act.held.popleft()
+            # The submitter gave up waiting
+            if fut.cancelled():
+                continue
+            act.queue.put_nowait(item)
+            fut.set_result(None)
@@ -0,0 +1,101 @@
+'''
+Benchmarks the memory used by tracker entries.
+
+Entries used to hold the member, emoji and datetime objects from the reaction that created them,
+which kept a member alive for everyone who ever reacted and an emoji for every reaction. They now
+only hold IDs. This builds the same reactions both ways and reports the memory per entry.
+
+Every reaction comes with its own emoji object, so the old entries are given one each. Members are
+shared between the entries for the same user, like they were when they came from the cache.
+
+Run from the repository root:
+    py bench/bench_memory.py
+'''
+from dataclasses import dataclass
+from datetime import datetime
+import gc
+import os
+import random
+import sys
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import disnake
+import tracker
+
+'''
+The entry as it was before it only held IDs
+'''
+@dataclass
+class legacyEntry:
+    user:       disnake.Member
+    react:      disnake.Emoji or str
+    timeStamp:  datetime
+    valid:      bool
+
+'''
+Just enough of the client state and guild for members to be created outside of a connection
+'''
+_state = SimpleNamespace(_get_guild=lambda i: None, _users={})
+_state.store_user = lambda d: disnake.User(state=_state, data=d)
+_guild = SimpleNamespace(id=1, _state=_state)
+
+def makeMember(uid:int) -> disnake.Member:
+    data = {
+        'user':      {'id': str(uid), 'username': 'user{}'.format(uid), 'discriminator': '0', 'avatar': None},
+        'roles':     [],
+        'joined_at': None,
+        'deaf':      False,
+        'mute':      False,
+    }
+    return disnake.Member(data=data, guild=_guild, state=_state)
+
+'''
+Makes a list of (user ID, emoji name) reactions from the given number of users and emojis
+'''
+def makeReactions(entries:int, users:int, emojis:int, seed:int=0) -> list:
+    rng = random.Random(seed)
+    names = [chr(0x1F600 + i) for i in range(emojis)]
+
+    return [(1000 + rng.randrange(users), rng.choice(names)) for _ in range(entries)]
+
+def buildLegacy(reactions:list) -> list:
+    members = {}
+    entries = []
+    for uid,name in reactions:
+        if uid not in members:
+            members[uid] = makeMember(uid)
+        entries.append(legacyEntry(members[uid], disnake.PartialEmoji(name=name), datetime.utcnow(), True))
+
+    return entries
+
+def buildCompact(reactions:list) -> list:
+    return [tracker.trackerEntry(uid, tracker.emojiKey(name), 1.7e9 + i, True) for i,(uid,name) in enumerate(reactions)]
+
+'''
+Returns the memory, in bytes, kept alive by what build returns
+'''
+def measure(build, reactions:list) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build(reactions)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del result
+    return after - before
+
+def main():
+    print('{:>8} {:>6} {:>14} {:>14} {:>8}'.format('entries', 'users', 'before', 'after', 'ratio'))
+    for entries,users in [(1000, 50), (10000, 200), (100000, 2000), (100000, 50000)]:
+        reactions = makeReactions(entries, users, emojis=10)
+        legacy  = measure(buildLegacy, reactions)
+        compact = measure(buildCompact, reactions)
+        print('{:>8} {:>6} {:>10.1f}B/e {:>10.1f}B/e {:>7.1f}x'.format(
+            entries, users, legacy / entries, compact / entries, legacy / compact))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+'''
+Benchmarks ExtMessage.splitMessage against message size.
+
+For each size this times a full split of a new message, splitting the same message again (which
+is memoized), and splitting after changing a line near the end or near the start of the message.
+Edits near the end only redo the last few messages, edits near the start redo everything.
+
+Run from the repository root:
+    py bench/bench_splitmessage.py
+'''
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import extmessage
+
+'''
+Makes a message of roughly the given size out of lines of random words, with some code blocks
+'''
+def makeMessage(size:int, codeBlockEvery:int=20, seed:int=0) -> str:
+    rng = random.Random(seed)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+
+    lines = []
+    total = 0
+    while total < size:
+        if (codeBlockEvery > 0) and (len(lines) % codeBlockEvery == codeBlockEvery - 1):
+            line = '```\n' + '\n'.join(' '.join(rng.choices(words, k=6)) for _ in range(3)) + '\n```'
+        else:
+            line = ' '.join(rng.choices(words, k=rng.randint(3, 15)))
+        lines.append(line)
+        total += len(line) + 1
+
+    return '\n'.join(lines)
+
+'''
+Returns the average time of a split in seconds for each case
+'''
+def benchSize(size:int, codeBlockEvery:int=20, number:int=20) -> dict:
+    base = makeMessage(size, codeBlockEvery)
+    lines = base.split('\n')
+    ext = extmessage.ExtMessage(msg=base)
+
+    # Alternate between two versions of the message so that every split sees a change
+    def variants(idx):
+        edited = list(lines)
+        edited[idx] = edited[idx] + ' edited'
+        return ['\n'.join(lines), '\n'.join(edited)]
+
+    def run(msgs, fresh):
+        def split():
+            run.cnt += 1
+            target = extmessage.ExtMessage(msgCnt=ext.msgCnt, msgRsv=0) if fresh else ext
+            target.msgCnt = ext.msgCnt
+            target.msg = msgs[run.cnt % len(msgs)]
+            target.splitMessage()
+        run.cnt = 0
+        split()
+        return timeit.timeit(split, number=number) / number
+
+    return {
+        'full':      run([base], fresh=True),
+        'unchanged': run([base], fresh=False),
+        'edit_tail': run(variants(len(lines) - 2), fresh=False),
+        'edit_head': run(variants(1), fresh=False),
+    }
+
+def main():
+    print('{:>8} {:>6} {:>12} {:>12} {:>12} {:>12}'.format('size', 'parts', 'full', 'unchanged', 'edit_tail', 'edit_head'))
+    for size in [1000, 4000, 16000, 64000, 256000]:
+        result = benchSize(size)
+        parts = extmessage.ExtMessage(msg=makeMessage(size)).msgCnt
+        print('{:>8} {:>6} {:>10.1f}us {:>10.1f}us {:>10.1f}us {:>10.1f}us'.format(
+            size, parts, *[result[k] * 1e6 for k in ['full', 'unchanged', 'edit_tail', 'edit_head']]))
+
+if __name__ == '__main__':
+    main()
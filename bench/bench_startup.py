@@ -0,0 +1,138 @@
+'''
+Measures how long the bot takes to start serving reactions after a restart, against the offline
+Discord in fakediscord.py.
+
+This creates a number of RSVP events with some sign-ups and shuts the tracker down, which leaves a
+snapshot behind. Then a fresh tracker and rsvp cog are started from that snapshot with Discord
+calls taking the given latency, and the following are reported:
+restore   - From the cogs being added until every saved item is tracked
+first     - From connecting until a reaction on a random event has been tracked
+prefetch  - From connecting until every saved item has been looked up from Discord
+api       - Calls made to Discord while starting up, by route
+
+Run from the repository root:
+    py bench/bench_startup.py --trackers 500 --latency 0.05
+'''
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import fakediscord
+import rsvp
+import tracker
+
+def addCogs(bot, dataDir:str, restoreConcurrency:int):
+    settings = {
+        'journalFile':        os.path.join(dataDir, 'reactTracker.journal'),
+        'snapshotFile':       os.path.join(dataDir, 'reactTracker.snapshot.json'),
+        'restoreConcurrency': restoreConcurrency,
+    }
+    trackerCog = tracker.reactTracker(bot=bot, settings=settings)
+    bot.add_cog(trackerCog)
+    rsvpCog = rsvp.rsvp(bot=bot, settings={})
+    bot.add_cog(rsvpCog)
+    return trackerCog,rsvpCog
+
+async def waitFor(cond, poll:float=0.001):
+    while not cond():
+        await asyncio.sleep(poll)
+
+'''
+Makes the events to restart with, and leaves the snapshot of them in dataDir. Returns the bot,
+the users and the event messages
+'''
+async def makeEvents(args, dataDir:str):
+    # Nothing is being measured yet, so don't wait on anything
+    api = fakediscord.FakeAPI(latency=0, jitter=0, limits=None, seed=args.seed)
+    bot = fakediscord.FakeBot(api)
+    guild = bot.addGuild('Startup')
+    users = [guild.addMember('user{}'.format(i)) for i in range(args.users)]
+
+    trackerCog,rsvpCog = addCogs(bot, dataDir, args.concurrency)
+    bot.ready.set()
+    await waitFor(lambda: trackerCog.loaded)
+
+    rng = random.Random(args.seed)
+    channel = guild.addChannel('events')
+    messages = []
+    for i in range(args.trackers):
+        ctx = fakediscord.FakeContext(users[i % len(users)], channel)
+        await rsvpCog.add.callback(rsvpCog, ctx, 'Event {}'.format(i), msgBody='⭐ option')
+        message = list(channel.messages.values())[-1]
+        messages.append(message)
+
+        for u in rng.sample(users, min(args.signups, len(users))):
+            await bot.dispatchReaction(message, u.id, '\U0001F64C', add=True)
+
+    await waitFor(lambda: len(trackerCog.actors.actors) == 0)
+    await asyncio.gather(*list(rsvpCog.seedTasks))
+    await bot.close()
+
+    return bot,users,messages
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as dataDir:
+        bot,users,messages = await makeEvents(args, dataDir)
+
+        # Start over on the same server, like after a restart
+        bot.api.latency = args.latency
+        bot.api.jitter  = args.latency / 2
+        bot.api.limits  = fakediscord.DEFAULT_LIMITS
+        bot.api.calls.clear()
+        bot.cogs   = {}
+        bot.closed = False
+        bot.ready  = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        start = loop.time()
+        trackerCog,_ = addCogs(bot, dataDir, args.concurrency)
+        await waitFor(lambda: trackerCog.loaded)
+        restore = loop.time() - start
+
+        # Connect, and react to something as soon as we can
+        bot.ready.set()
+        connected = loop.time()
+        message = random.Random(args.seed).choice(messages)
+        user = users[-1]
+        await bot.dispatchReaction(message, user.id, '⭐', add=True)
+        await waitFor(lambda: (user.id, tracker.emojiKey('⭐')) in trackerCog.trackedItems[message.id].validIndex)
+        first = loop.time() - connected
+
+        await waitFor(lambda: all(v.saved is None for v in trackerCog.trackedItems.values()), poll=0.01)
+        prefetch = loop.time() - connected
+
+        calls = dict(bot.api.calls)
+        tracked = len(trackerCog.trackedItems)
+        await trackerCog.renderer.flushAll()
+        await bot.close()
+
+    return {'restore': restore, 'first': first, 'prefetch': prefetch, 'calls': calls, 'tracked': tracked}
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how long the bot takes to start serving after a restart')
+    parser.add_argument('--trackers',    type=int,   default=200,  help='Number of RSVP events to restore')
+    parser.add_argument('--signups',     type=int,   default=20,   help='Number of sign-ups on each event')
+    parser.add_argument('--users',       type=int,   default=100,  help='Number of users in the server')
+    parser.add_argument('--latency',     type=float, default=0.05, help='Seconds each Discord call takes while restarting')
+    parser.add_argument('--concurrency', type=int,   default=8,    help='restoreConcurrency setting')
+    parser.add_argument('--seed',        type=int,   default=0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    print()
+    print('{} events with {} sign-ups each, {:.0f}ms per Discord call'.format(args.trackers, args.signups, args.latency * 1e3))
+    print('tracked:      {}'.format(result['tracked']))
+    print('restore:      {:.1f}ms'.format(result['restore'] * 1e3))
+    print('first:        {:.1f}ms'.format(result['first'] * 1e3))
+    print('prefetch:     {:.2f}s'.format(result['prefetch']))
+    print('api calls:    {}'.format(sum(result['calls'].values())))
+    for k,v in sorted(result['calls'].items()):
+        print('    {:<16} {}'.format(k, v))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+'''
+An offline stand-in for the parts of Discord that the cogs use, so they can be run and measured
+without a connection.
+
+This only covers what tracker.py, rsvp.py and extmessage.py actually touch: the bot, guilds,
+members, channels, messages and their reactions. Everything lives in memory. Every call that would
+go to Discord goes through FakeAPI instead, which counts it, waits out a simulated round trip and
+simulates Discord's rate limits. A call that goes over its bucket is counted as rate limited and
+waits for the bucket to reset before going through, which is what the library does with a 429.
+
+Embeds are real disnake Embeds since they don't need a connection.
+'''
+import asyncio
+from collections import Counter,deque
+import disnake
+import itertools
+import random
+from typing import Any,Dict,List
+
+'''
+Discord's rate limits for the routes we use, as (calls, per seconds). These are all per channel
+'''
+DEFAULT_LIMITS = {
+    'send':            (5, 5.0),
+    'edit':            (5, 5.0),
+    'delete':          (5, 5.0),
+    'add_reaction':    (1, 0.25),
+    'remove_reaction': (1, 0.25),
+    'clear_reactions': (1, 0.25),
+    'fetch_message':   (50, 1.0),
+    'reaction_users':  (50, 1.0),
+    'fetch_member':    (50, 1.0),
+    'query_members':   (120, 60.0),
+}
+
+'''
+Simulates the round trip and rate limits of calls to Discord, and counts them
+
+latency   - Average seconds a call takes
+jitter    - Calls take latency +/- this many seconds
+limits    - Rate limits by route, see DEFAULT_LIMITS. None turns off rate limiting
+'''
+class FakeAPI():
+    def __init__(self, latency:float=0.05, jitter:float=0.02, limits:Dict[str, tuple]=DEFAULT_LIMITS, seed:int=0):
+        self.latency = latency
+        self.jitter  = jitter
+        self.limits  = limits
+        self.rng     = random.Random(seed)
+
+        self.calls       = Counter()
+        self.rateLimited = Counter()
+        self.buckets: Dict[Any, deque] = {}
+
+    async def call(self, route:str, bucket:Any=None):
+        self.calls[route] += 1
+
+        limit = None if self.limits is None else self.limits.get(route)
+        if limit is not None:
+            rate,per = limit
+            starts = self.buckets.setdefault((route, bucket), deque(maxlen=rate))
+
+            loop = asyncio.get_running_loop()
+            while (len(starts) == rate) and (starts[0] + per > loop.time()):
+                self.rateLimited[route] += 1
+                await asyncio.sleep(starts[0] + per - loop.time())
+            starts.append(loop.time())
+
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def totalCalls(self) -> int:
+        return sum(self.calls.values())
+
+_ids = itertools.count(100000)
+
+def nextId() -> int:
+    return next(_ids)
+
+class FakeUser():
+    def __init__(self, uid:int, name:str):
+        self.id           = uid
+        self.name         = name
+        self.display_name = name
+        self.bot          = False
+
+    @property
+    def mention(self) -> str:
+        return '<@{}>'.format(self.id)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and (other.id == self.id)
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMember(FakeUser):
+    def __init__(self, uid:int, name:str, guild:'FakeGuild'):
+        super().__init__(uid, name)
+        self.guild = guild
+
+'''
+A reaction on a message, and the users who made it in the order they made it
+'''
+class FakeReaction():
+    def __init__(self, message:'FakeMessage', emoji):
+        self.message = message
+        self.emoji   = emoji
+        self.userIds: Dict[int, None] = {}
+
+    @property
+    def count(self) -> int:
+        return len(self.userIds)
+
+    @property
+    def me(self) -> bool:
+        return self.message.channel.guild.bot.user.id in self.userIds
+
+    async def users(self, limit=None):
+        # Discord hands these out 100 at a time
+        userIds = list(self.userIds)
+        for i in range(0, len(userIds), 100):
+            await self.message.api.call('reaction_users', self.message.channel.id)
+            for uid in userIds[i:i + 100]:
+                yield self.message.channel.guild.bot.users[uid]
+
+class FakeMessage():
+    def __init__(self, channel:'FakeChannel', content:str=None, embed:disnake.Embed=None):
+        self.id        = nextId()
+        self.channel   = channel
+        self.guild     = channel.guild
+        self.api       = channel.api
+        self.content   = content
+        self.embeds    = [] if embed is None else [embed]
+        self.reactions: List[FakeReaction] = []
+        self.deleted   = False
+
+    def _reaction(self, emoji, create:bool) -> FakeReaction:
+        key = str(emoji)
+        for r in self.reactions:
+            if str(r.emoji) == key:
+                return r
+
+        if not create:
+            return None
+
+        r = FakeReaction(self, emoji)
+        self.reactions.append(r)
+        return r
+
+    '''
+    Records a reaction without any API call. This is how reactions from other users show up
+    '''
+    def react(self, userId:int, emoji, add:bool=True) -> bool:
+        r = self._reaction(emoji, create=add)
+        if add:
+            if userId in r.userIds:
+                return False
+            r.userIds[userId] = None
+            return True
+
+        if (r is None) or (userId not in r.userIds):
+            return False
+        r.userIds.pop(userId)
+        if r.count == 0:
+            self.reactions.remove(r)
+        return True
+
+    async def edit(self, content:str=None, embed:disnake.Embed=None, **kwargs):
+        await self.api.call('edit', self.channel.id)
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        return self
+
+    async def delete(self, delay:float=None):
+        await self.api.call('delete', self.channel.id)
+        self.deleted = True
+        self.channel.messages.pop(self.id, None)
+
+    async def add_reaction(self, emoji):
+        await self.api.call('add_reaction', self.channel.id)
+        self.react(self.channel.guild.bot.user.id, emoji)
+
+    async def remove_reaction(self, emoji, member=None):
+        await self.api.call('remove_reaction', self.channel.id)
+        self.react(self.channel.guild.bot.user.id if member is None else member.id, emoji, add=False)
+
+    async def clear_reactions(self):
+        await self.api.call('clear_reactions', self.channel.id)
+        self.reactions = []
+
+class FakeChannel():
+    def __init__(self, guild:'FakeGuild', name:str):
+        self.id       = nextId()
+        self.name     = name
+        self.guild    = guild
+        self.api      = guild.api
+        self.messages: Dict[int, FakeMessage] = {}
+
+    async def send(self, content:str=None, embed:disnake.Embed=None, **kwargs) -> FakeMessage:
+        await self.api.call('send', self.id)
+        msg = FakeMessage(self, content, embed)
+        self.messages[msg.id] = msg
+        return msg
+
+    async def fetch_message(self, msgId:int) -> FakeMessage:
+        await self.api.call('fetch_message', self.id)
+        msg = self.messages.get(msgId)
+        if msg is None:
+            raise disnake.NotFound(_FakeResponse(404), 'Unknown Message')
+        return msg
+
+    def get_partial_message(self, msgId:int) -> FakeMessage:
+        return self.messages.get(msgId)
+
+'''
+The library's HTTP exceptions need something that looks like a response
+'''
+class _FakeResponse():
+    def __init__(self, status:int):
+        self.status = status
+        self.reason = 'Fake'
+
+'''
+A guild. Members are only in the client cache if cacheMembers is set, which is what happens with
+the members intent. Without it, members have to be fetched or queried like they do in production
+'''
+class FakeGuild():
+    def __init__(self, bot:'FakeBot', name:str, cacheMembers:bool=False):
+        self.id           = nextId()
+        self.name         = name
+        self.bot          = bot
+        self.api          = bot.api
+        self.cacheMembers = cacheMembers
+        self.users: Dict[int, FakeMember] = {}
+        self.text_channels: List[FakeChannel] = []
+
+    def addChannel(self, name:str) -> FakeChannel:
+        channel = FakeChannel(self, name)
+        self.text_channels.append(channel)
+        self.bot.channels[channel.id] = channel
+        return channel
+
+    def addMember(self, name:str) -> FakeMember:
+        member = FakeMember(nextId(), name, self)
+        self.users[member.id] = member
+        self.bot.users[member.id] = member
+        return member
+
+    def get_member(self, userId:int) -> FakeMember:
+        return self.users.get(userId) if self.cacheMembers else None
+
+    async def fetch_member(self, userId:int) -> FakeMember:
+        await self.api.call('fetch_member', self.id)
+        member = self.users.get(userId)
+        if member is None:
+            raise disnake.NotFound(_FakeResponse(404), 'Unknown Member')
+        return member
+
+    async def query_members(self, query:str=None, *, limit:int=5, user_ids:List[int]=None, presences:bool=False, cache:bool=True):
+        await self.api.call('query_members', self.id)
+        return [self.users[u] for u in (user_ids or []) if u in self.users][:limit]
+
+'''
+What the library hands the raw reaction listeners. This also keeps when it was dispatched for timing
+'''
+class FakeReactionPayload():
+    def __init__(self, message:FakeMessage, userId:int, emoji, add:bool):
+        self.message_id = message.id
+        self.channel_id = message.channel.id
+        self.guild_id   = message.guild.id
+        self.user_id    = userId
+        self.emoji      = emoji if isinstance(emoji, disnake.PartialEmoji) else disnake.PartialEmoji(name=emoji)
+        self.member     = message.guild.users.get(userId) if add else None
+        self.event_type = 'REACTION_ADD' if add else 'REACTION_REMOVE'
+        self.dispatched = asyncio.get_running_loop().time()
+
+'''
+What commands are called with
+'''
+class FakeContext():
+    def __init__(self, author:FakeMember, channel:FakeChannel):
+        self.author  = author
+        self.channel = channel
+        self.guild   = channel.guild
+        self.message = FakeMessage(channel, content='')
+
+    async def send(self, content:str=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+'''
+The bot. Cogs are added directly and are never loaded through the library, so listeners have to
+be called by whoever is driving the bot (see dispatchReaction)
+'''
+class FakeBot():
+    def __init__(self, api:FakeAPI=None):
+        self.api      = FakeAPI() if api is None else api
+        self.loop     = asyncio.get_running_loop()
+        self.user     = FakeUser(nextId(), 'lolotron')
+        self.guilds: List[FakeGuild] = []
+        self.channels: Dict[int, FakeChannel] = {}
+        self.users: Dict[int, FakeUser] = {self.user.id: self.user}
+        self.cogs: Dict[str, Any] = {}
+
+        self.ready  = asyncio.Event()
+        self.closed = False
+
+    def addGuild(self, name:str, cacheMembers:bool=False) -> FakeGuild:
+        guild = FakeGuild(self, name, cacheMembers)
+        self.guilds.append(guild)
+        return guild
+
+    def add_cog(self, cog):
+        self.cogs[type(cog).__name__] = cog
+
+    def get_cog(self, name:str):
+        return self.cogs.get(name)
+
+    def get_channel(self, channelId:int) -> FakeChannel:
+        return self.channels.get(channelId)
+
+    async def fetch_channel(self, channelId:int) -> FakeChannel:
+        await self.api.call('fetch_channel')
+        return self.channels[channelId]
+
+    def get_guild(self, guildId:int) -> FakeGuild:
+        for g in self.guilds:
+            if g.id == guildId:
+                return g
+        return None
+
+    async def fetch_guild(self, guildId:int) -> FakeGuild:
+        await self.api.call('fetch_guild')
+        return self.get_guild(guildId)
+
+    def get_user(self, userId:int) -> FakeUser:
+        return self.users.get(userId)
+
+    def get_emoji(self, emojiId:int):
+        return None
+
+    async def wait_until_ready(self):
+        await self.ready.wait()
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+    '''
+    Records a reaction on the message and calls the cog listeners for it, like the gateway would.
+    If add is None, the reaction is added if the user doesn't have it and removed if they do.
+    Returns the payload, or None if the reaction didn't change anything and there wouldn't be an event
+    '''
+    async def dispatchReaction(self, message:FakeMessage, userId:int, emoji, add:bool=None) -> FakeReactionPayload:
+        if add is None:
+            r = message._reaction(emoji, create=False)
+            add = (r is None) or (userId not in r.userIds)
+
+        if not message.react(userId, emoji, add):
+            return None
+
+        payload = FakeReactionPayload(message, userId, emoji, add)
+        name = 'on_raw_reaction_add' if add else 'on_raw_reaction_remove'
+        for cog in list(self.cogs.values()):
+            listener = getattr(cog, name, None)
+            if listener is not None:
+                await listener(payload)
+
+        return payload
+
+    async def close(self):
+        reactTracker = self.get_cog('reactTracker')
+        if reactTracker is not None:
+            await reactTracker.shutdown()
+        self.closed = True
@@ -0,0 +1,237 @@
+'''
+Load tests the reactTracker and rsvp cogs against the offline Discord in fakediscord.py.
+
+This creates a number of RSVP events, then replays a storm of reactions on them from a pool of
+users. Each reaction picks an event, a user and one of the sign-up, special or an untracked emoji.
+If the user already has that reaction it is removed instead. Reactions are dispatched to the cogs
+as their own tasks, like the gateway does, either as fast as possible or at a fixed rate.
+
+The following are reported for the storm:
+events/s  - Reactions handled per second, from the first dispatch until everything was rendered
+latency   - Time from a reaction being dispatched until the tracker finished handling it
+api       - Calls made to Discord, by route, and how many of them were rate limited
+memory    - Memory allocated during the storm that is still in use, and the peak. This comes from
+            a second run with tracemalloc on since it slows everything down
+
+At the end, every event is checked against the reactions on its message and any differences are
+reported. There shouldn't be any.
+
+Run from the repository root:
+    py bench/loadtest.py --events 20000 --users 500 --emojis 5 --trackers 10
+'''
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import fakediscord
+import rsvp
+import tracker
+
+# Special emojis to put at the start of lines in the events, and one that nothing tracks
+SPECIAL_EMOJIS  = ['⭐', '\U0001F525', '\U0001F389', '\U0001F355', '\U0001F680',
+                   '\U0001F3AF', '\U0001F9EA', '\U0001F6E1', '\U0001F3F9', '\U0001F48E']
+UNTRACKED_EMOJI = '❓'
+
+'''
+Sets up a bot with the cogs, the users and the RSVP events. Returns the bot, the tracker cog,
+the rsvp cog, the event messages and the users
+'''
+async def setup(args, dataDir:str):
+    api = fakediscord.FakeAPI(latency=args.latency, jitter=args.latency / 2,
+                              limits=None if args.no_ratelimit else fakediscord.DEFAULT_LIMITS,
+                              seed=args.seed)
+    bot = fakediscord.FakeBot(api)
+    guild = bot.addGuild('Load Test', cacheMembers=args.cache_members)
+
+    trackerSettings = {
+        'renderDebounce':   args.debounce,
+        'renderMaxLatency': args.max_latency,
+        'journalFile':      os.path.join(dataDir, 'reactTracker.journal'),
+        'snapshotFile':     os.path.join(dataDir, 'reactTracker.snapshot.json'),
+    }
+    trackerCog = tracker.reactTracker(bot=bot, settings=trackerSettings)
+    bot.add_cog(trackerCog)
+    rsvpCog = rsvp.rsvp(bot=bot, settings={})
+    bot.add_cog(rsvpCog)
+
+    bot.ready.set()
+    while not trackerCog.loaded:
+        await asyncio.sleep(0.01)
+
+    users = [guild.addMember('user{}'.format(i)) for i in range(args.users)]
+
+    # Each event is made by a different owner in its own channel
+    body = '\n'.join('{} option {}'.format(e, i) for i,e in enumerate(SPECIAL_EMOJIS[:args.emojis]))
+    messages = []
+    for i in range(args.trackers):
+        channel = guild.addChannel('events{}'.format(i))
+        ctx = fakediscord.FakeContext(users[i % len(users)], channel)
+        await rsvpCog.add.callback(rsvpCog, ctx, 'Event {}'.format(i), msgBody=body)
+        messages.append(list(channel.messages.values())[-1])
+
+    # Get everything from creating the events out of the way
+    await trackerCog.renderer.flushAll()
+    await asyncio.gather(*list(rsvpCog.seedTasks))
+
+    return bot,trackerCog,rsvpCog,messages,users
+
+'''
+Times how long the tracker takes to handle each reaction from when it was dispatched
+'''
+def instrument(trackerCog, latencies:list):
+    loop = asyncio.get_running_loop()
+
+    def wrap(handler):
+        async def timed(payload):
+            try:
+                await handler(payload)
+            finally:
+                latencies.append(loop.time() - payload.dispatched)
+        return timed
+
+    trackerCog._reactionAdd    = wrap(trackerCog._reactionAdd)
+    trackerCog._reactionRemove = wrap(trackerCog._reactionRemove)
+
+'''
+Makes the list of reactions for the storm as (message, user ID, emoji)
+'''
+def makeStorm(args, messages:list, users:list) -> list:
+    rng = random.Random(args.seed)
+    emojis = ['\U0001F64C'] + SPECIAL_EMOJIS[:args.emojis] + [UNTRACKED_EMOJI]
+
+    # Most reactions are sign-ups
+    weights = [len(emojis)] + [1] * (len(emojis) - 1)
+
+    return [(rng.choice(messages), rng.choice(users).id, rng.choices(emojis, weights)[0])
+            for _ in range(args.events)]
+
+'''
+Runs the storm and waits until everything it caused is done. Returns the seconds it took
+'''
+async def runStorm(args, bot, trackerCog, storm:list) -> float:
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    tasks = []
+    for i,(message,userId,emoji) in enumerate(storm):
+        # Reactions the user already has are taken away instead
+        tasks.append(loop.create_task(bot.dispatchReaction(message, userId, emoji)))
+
+        # Let the handlers run every so often, and hold back to the requested rate if there is one
+        if args.rate > 0:
+            delay = start + (i + 1) / args.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 100 == 99:
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*tasks)
+    while len(trackerCog.actors.actors) > 0:
+        await asyncio.sleep(0.001)
+    await trackerCog.renderer.flushAll()
+
+    return loop.time() - start
+
+'''
+Counts the valid entries that don't match the reactions on their message, in either direction
+'''
+def countMismatches(bot, trackerCog, messages:list) -> int:
+    mismatches = 0
+    for message in messages:
+        event = trackerCog.getTrackedItem(message.id)
+        actual = {(u, tracker.emojiKey(r.emoji)) for r in message.reactions for u in r.userIds if u != bot.user.id}
+        mismatches += len(actual.symmetric_difference(event.validIndex))
+
+    return mismatches
+
+async def runOnce(args, traceMemory:bool) -> dict:
+    with tempfile.TemporaryDirectory() as dataDir:
+        bot,trackerCog,rsvpCog,messages,users = await setup(args, dataDir)
+        storm = makeStorm(args, messages, users)
+
+        latencies = []
+        instrument(trackerCog, latencies)
+
+        callsBefore   = dict(bot.api.calls)
+        limitedBefore = sum(bot.api.rateLimited.values())
+        skippedBefore = rsvpCog.editsSkipped
+
+        if traceMemory:
+            tracemalloc.start()
+        elapsed = await runStorm(args, bot, trackerCog, storm)
+        if traceMemory:
+            memCurrent,memPeak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        else:
+            memCurrent,memPeak = None,None
+
+        result = {
+            'handled':     len(latencies),
+            'elapsed':     elapsed,
+            'latencies':   latencies,
+            'calls':       {k: v - callsBefore.get(k, 0) for k,v in bot.api.calls.items() if v > callsBefore.get(k, 0)},
+            'rateLimited': sum(bot.api.rateLimited.values()) - limitedBefore,
+            'editsSkipped':rsvpCog.editsSkipped - skippedBefore,
+            'mismatches':  countMismatches(bot, trackerCog, messages),
+            'memCurrent':  memCurrent,
+            'memPeak':     memPeak,
+        }
+
+        await bot.close()
+
+    return result
+
+def percentile(values:list, pct:float) -> float:
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def report(args, result:dict, memory:dict):
+    lat = result['latencies']
+    print()
+    print('{} reactions on {} events from {} users with {} special emojis'.format(
+        args.events, args.trackers, args.users, args.emojis))
+    print('handled:      {}'.format(result['handled']))
+    print('elapsed:      {:.3f}s'.format(result['elapsed']))
+    print('events/s:     {:.0f}'.format(result['handled'] / result['elapsed']))
+    print('latency:      p50 {:.2f}ms  p99 {:.2f}ms  max {:.2f}ms  mean {:.2f}ms'.format(
+        percentile(lat, 50) * 1e3, percentile(lat, 99) * 1e3, max(lat, default=0) * 1e3,
+        (statistics.mean(lat) if len(lat) > 0 else 0) * 1e3))
+    print('api calls:    {} ({} rate limited)'.format(sum(result['calls'].values()), result['rateLimited']))
+    for k,v in sorted(result['calls'].items()):
+        print('    {:<16} {}'.format(k, v))
+    print('edits skipped:{:>4}'.format(result['editsSkipped']))
+    if memory is not None:
+        print('memory:       {:.2f}MB in use, {:.2f}MB peak'.format(memory['memCurrent'] / 2**20, memory['memPeak'] / 2**20))
+    print('mismatches:   {}'.format(result['mismatches']))
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the reaction tracker with an offline Discord')
+    parser.add_argument('--events',        type=int,   default=20000, help='Number of reactions')
+    parser.add_argument('--users',         type=int,   default=500,   help='Number of users reacting')
+    parser.add_argument('--emojis',        type=int,   default=5,     help='Number of special emojis per event (up to {})'.format(len(SPECIAL_EMOJIS)))
+    parser.add_argument('--trackers',      type=int,   default=10,    help='Number of RSVP events')
+    parser.add_argument('--rate',          type=float, default=0,     help='Reactions per second to dispatch at, 0 for as fast as possible')
+    parser.add_argument('--latency',       type=float, default=0.05,  help='Seconds each Discord call takes')
+    parser.add_argument('--debounce',      type=float, default=1.0,   help='renderDebounce setting')
+    parser.add_argument('--max-latency',   type=float, default=5.0,   help='renderMaxLatency setting')
+    parser.add_argument('--no-ratelimit',  action='store_true',       help='Turn off rate limit simulation')
+    parser.add_argument('--cache-members', action='store_true',       help='Have members in the client cache, like with the members intent')
+    parser.add_argument('--no-memory',     action='store_true',       help='Skip the memory run')
+    parser.add_argument('--seed',          type=int,   default=0)
+    args = parser.parse_args()
+    args.emojis = min(args.emojis, len(SPECIAL_EMOJIS))
+
+    result = asyncio.run(runOnce(args, traceMemory=False))
+    memory = None if args.no_memory else asyncio.run(runOnce(args, traceMemory=True))
+    report(args, result, memory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+'''
+Runs the micro-benchmarks for the hot functions that don't need Discord, and compares them against
+a stored baseline.
+
+Covered:
+split_*   - ExtMessage.splitMessage of a new message by size and how often code blocks show up
+line_*    - ExtMessage.splitMessageLine of a single long line by size
+parse_*   - rsvp.parseMsg by number of lines and the kind of emoji starting them, with the parser's
+            cache off, and with it on and the message unchanged (cached)
+roster_*  - Rebuilding the rsvp roster from its entries, and packing it into embed fields, by signups
+gc_*      - reactTracker.gc by number of tracked items, when nothing has expired (which is what
+            every reaction pays for) and when everything has
+restore_* - reactTracker.restore by number of saved RSVP events, which is what has to happen after a
+            restart before reactions can be tracked
+
+Every benchmark is warmed up and then timed over several runs, and the whole set is run a few
+rounds so that something else briefly hogging the machine only spoils some of the runs. The result
+is the best run, in seconds per call, and the spread is how far the best run of a typical round is
+above that, as a fraction of it, which is how noisy that benchmark is on this machine.
+
+Results are written as JSON and compared against the baseline. Each benchmark is allowed to be
+slower than the baseline by the tolerance plus a few times the larger of its spreads, so noisy
+benchmarks get more room than steady ones. Anything over that is run again a few more times,
+and is only reported as a regression if its best run still isn't within the allowance. The exit
+code is 1 if there are any regressions, so this can gate changes.
+
+The baseline should only be re-recorded in its own commit, saying why the numbers changed.
+
+Run from the repository root:
+    py bench/run.py                       Run everything and compare against bench/baseline.json
+    py bench/run.py --filter split        Only run benchmarks with split in their name
+    py bench/run.py --output out.json     Also write the results to out.json
+    py bench/run.py --save-baseline       Replace the baseline with these results
+    py bench/run.py --rounds 5            Run everything 5 times over for steadier results
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import timeit
+from datetime import datetime,timedelta
+from types import SimpleNamespace
+from typing import Callable,Dict,List,Tuple
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import disnake
+import emojiparser
+import extmessage
+import rsvp
+import tracker
+from bench_splitmessage import makeMessage
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# How many times the spread a benchmark is allowed on top of the tolerance
+SPREAD_ALLOWANCE = 2
+
+'''
+Returns the time per call of fn in seconds for each run. Each run calls fn enough times to take a
+while, and one untimed run warms it up first
+'''
+def timePerCall(fn:Callable[[], None], repeat:int=3) -> List[float]:
+    timer = timeit.Timer(fn)
+    number,_ = timer.autorange()
+    timer.timeit(number=number)
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+'''
+Returns the time of fn in seconds for each run, when fn can only be called once per setup. setup
+returns what fn is called with. The first run warms it up and isn't counted. Like timeit, garbage
+collection is off while fn runs so it doesn't land on random runs
+'''
+def timeOnce(setup:Callable[[], object], fn:Callable[[object], None], repeat:int=3) -> List[float]:
+    times = []
+    for _ in range(repeat + 1):
+        arg = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            t = timeit.default_timer()
+            fn(arg)
+            times.append(timeit.default_timer() - t)
+        finally:
+            gc.enable()
+    return times[1:]
+
+'''
+Returns the best of the runs, and how far the best of a typical round is above it as a fraction of
+the best. Runs in the same round are close together, so the rounds show how much the best moves
+'''
+def summarize(rounds:List[List[float]]) -> Tuple[float, float]:
+    bests = [min(r) for r in rounds]
+    best = min(bests)
+    return best, (statistics.median(bests) - best) / best
+
+def splitCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    cases = []
+    for size in [1000, 16000, 64000]:
+        for codeBlockEvery in [0, 5, 20]:
+            msg = makeMessage(size, codeBlockEvery)
+            msgCnt = extmessage.ExtMessage(msg=msg).msgCnt
+
+            def split(msg=msg, msgCnt=msgCnt):
+                ext = extmessage.ExtMessage(msgCnt=msgCnt, msgRsv=0, msg=msg)
+                ext.msgCnt = msgCnt
+                ext.splitMessage()
+
+            name = 'split_{}_code{}'.format(size, codeBlockEvery) if codeBlockEvery > 0 else 'split_{}_nocode'.format(size)
+            cases.append((name, lambda split=split: timePerCall(split)))
+
+    ext = extmessage.ExtMessage()
+    rng = random.Random(0)
+    words = ['lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit']
+    for size in [2000, 20000, 200000]:
+        line = ''
+        while len(line) < size:
+            line += rng.choice(words) + ' '
+        cases.append(('line_{}'.format(size), lambda line=line: timePerCall(lambda: ext.splitMessageLine(line))))
+
+    return cases
+
+'''
+Makes an RSVP body with the given number of lines. Every few lines starts with an emoji of the
+given kind, and the rest are plain text
+'''
+def makeBody(lines:int, kind:str, seed:int=0) -> str:
+    rng = random.Random(seed)
+    unicode = ['⭐', '\U0001F525', '\U0001F389', '\U0001F355', '\U0001F680', '\U0001F3AF']
+    custom  = ['<:emoji{}:{}>'.format(i, 556941054277058560 + i) for i in range(6)]
+    pool = {'unicode': unicode, 'custom': custom, 'mixed': unicode + custom, 'plain': []}[kind]
+
+    body = []
+    for i in range(lines):
+        text = 'line {} of the event details'.format(i)
+        if (len(pool) > 0) and (i % 3 == 0):
+            body.append('{} {}'.format(rng.choice(pool), text))
+        else:
+            body.append(text)
+    return '\n'.join(body)
+
+'''
+What parseMsg needs from the cog
+'''
+def makeParseCog(cacheSize:int=0) -> SimpleNamespace:
+    return SimpleNamespace(emojiParser=emojiparser.EmojiParser(cacheSize=cacheSize), rsvpEmoji=disnake.PartialEmoji(name='\U0001F64C'))
+
+def parseCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    cases = []
+    for lines in [10, 100, 1000]:
+        for kind in ['plain', 'unicode', 'custom', 'mixed']:
+            event = tracker.Tracker(SimpleNamespace(id=1), makeBody(lines, kind), None, [], datetime.utcnow(), None, 'rsvp')
+
+            def parse(event=event, cog=makeParseCog()):
+                event.cogData = None
+                rsvp.rsvp.parseMsg(cog, event)
+
+            cases.append(('parse_{}_{}'.format(lines, kind), lambda parse=parse: timePerCall(parse)))
+
+        def parseCached(event=event, cog=makeParseCog(cacheSize=256)):
+            event.cogData = None
+            rsvp.rsvp.parseMsg(cog, event)
+
+        cases.append(('parse_{}_cached'.format(lines), lambda parseCached=parseCached: timePerCall(parseCached)))
+
+    return cases
+
+def rosterCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    rsvpEmoji = disnake.PartialEmoji(name='\U0001F64C')
+    specials  = [disnake.PartialEmoji(name=e) for e in ['⭐', '\U0001F525', '\U0001F389']]
+    header    = 'Please react to this message with {} to join.\n'.format(rsvpEmoji)
+
+    cases = []
+    for signups in [10, 100, 1000, 5000]:
+        rng = random.Random(signups)
+        entries = []
+        for uid in range(2, signups + 2):
+            entries.append(tracker.trackerEntry(uid, tracker.emojiKey(rsvpEmoji), 0.0, True))
+            if rng.random() < 0.3:
+                entries.append(tracker.trackerEntry(uid, tracker.emojiKey(rng.choice(specials)), 0.0, True))
+        users = {uid: SimpleNamespace(id=uid, display_name='user{}'.format(uid)) for uid in range(1, signups + 2)}
+
+        def rebuild(entries=entries):
+            rsvp.rsvpRoster(1, rsvpEmoji, specials).rebuild(entries)
+
+        roster = rsvp.rsvpRoster(1, rsvpEmoji, specials)
+        roster.rebuild(entries)
+
+        cases.append(('roster_rebuild_{}'.format(signups), lambda rebuild=rebuild: timePerCall(rebuild)))
+        cases.append(('roster_fields_{}'.format(signups),
+                      lambda roster=roster,users=users: timePerCall(lambda: roster.renderFields(header, users))))
+
+    return cases
+
+'''
+Makes a reactTracker with the given number of tracked items. The tracker's background tasks are
+never started and nothing is written to the journal, so it only has what gc touches
+'''
+def makeTracker(count:int, expired:bool) -> tracker.reactTracker:
+    bot = SimpleNamespace(loop=SimpleNamespace(create_task=lambda coro: coro.close()), user=None)
+    t = tracker.reactTracker(bot, {})
+
+    now = datetime.utcnow()
+    for i in range(count):
+        expire = now - timedelta(seconds=1) if expired else now + timedelta(days=1, seconds=i)
+        item = tracker.Tracker(SimpleNamespace(id=1), '', SimpleNamespace(id=i), [], expire, None, 'rsvp')
+        t._addTrackedItem(i, item)
+
+    return t
+
+def gcCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    def run(count:int, expired:bool) -> float:
+        if not expired:
+            return timePerCall(makeTracker(count, expired=False).gc)
+
+        return timeOnce(lambda: makeTracker(count, expired=True), lambda t: t.gc(), repeat=3)
+
+    cases = []
+    for count in [10, 1000, 100000]:
+        cases.append(('gc_{}_idle'.format(count),    lambda count=count: run(count, expired=False)))
+        cases.append(('gc_{}_expired'.format(count), lambda count=count: run(count, expired=True)))
+
+    return cases
+
+'''
+Makes the saved state of the given number of RSVP events with 20 sign-ups each, like it is read
+back from the snapshot
+'''
+def makeState(count:int) -> Dict[int, dict]:
+    rsvpEmoji = tracker.emojiKey(disnake.PartialEmoji(name='\U0001F64C'))
+    expire = tracker.Tracker.encodeExpire(datetime.utcnow() + timedelta(days=1))
+
+    state = {}
+    for i in range(count):
+        state[i] = {
+            'owner':      1,
+            'ownerGuild': 1,
+            'msg':        makeBody(5, 'mixed', seed=i),
+            'msgId':      i,
+            'channel':    1,
+            'entries':    [{'user': 2 + u, 'reactType': 'unicode', 'react': rsvpEmoji, 'timeStamp': 1.7e9 + u, 'valid': True}
+                           for u in range(20)],
+            'expire':     expire + i,
+            'cogOwner':   'rsvp',
+        }
+    return state
+
+def restoreCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    def setup(state):
+        cog = makeParseCog(cacheSize=256)
+        t = makeTracker(0, expired=False)
+        t.procCb['rsvp'] = lambda event: rsvp.rsvp.parseMsg(cog, event)
+        return t
+
+    cases = []
+    for count in [100, 1000, 10000]:
+        state = makeState(count)
+        cases.append(('restore_{}'.format(count),
+                      lambda state=state: timeOnce(lambda: setup(state), lambda t: t.restore(state), repeat=3)))
+
+    return cases
+
+def allCases() -> List[Tuple[str, Callable[[], List[float]]]]:
+    return splitCases() + parseCases() + rosterCases() + gcCases() + restoreCases()
+
+'''
+Compares results against the baseline. Returns the names of the benchmarks that regressed
+'''
+def compare(results:Dict[str, float], spreads:Dict[str, float], baseline:dict, tolerance:float,
+            quiet:bool=False) -> List[str]:
+    regressions = []
+
+    if not quiet:
+        print()
+        print('{:<28} {:>12} {:>12} {:>8} {:>8}'.format('benchmark', 'baseline', 'current', 'change', 'allowed'))
+    for name,current in results.items():
+        base = baseline['results'].get(name)
+        if base is None:
+            if not quiet:
+                print('{:<28} {:>12} {:>10.2f}us {:>8}'.format(name, '-', current * 1e6, 'new'))
+            continue
+
+        allowed = tolerance + SPREAD_ALLOWANCE * max(spreads.get(name, 0.0), baseline['spread'].get(name, 0.0))
+        change = (current / base) - 1
+        flag = ''
+        if change > allowed:
+            flag = ' REGRESSED'
+            regressions.append(name)
+        elif change < -allowed:
+            flag = ' improved'
+        if not quiet:
+            print('{:<28} {:>10.2f}us {:>10.2f}us {:>+7.0%} {:>7.0%}{}'.format(name, base * 1e6, current * 1e6, change, allowed, flag))
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the micro-benchmarks and compare against a baseline')
+    parser.add_argument('--filter',        default='',            help='Only run benchmarks with this in their name')
+    parser.add_argument('--output',        default=None,          help='Write the results as JSON to this file')
+    parser.add_argument('--baseline',      default=BASELINE_FILE, help='Baseline to compare against')
+    parser.add_argument('--tolerance',     type=float, default=0.25, help='How much slower than the baseline is allowed, as a fraction')
+    parser.add_argument('--rounds',        type=int, default=3,   help='How many times to run every benchmark')
+    parser.add_argument('--confirm',       type=int, default=3,   help='How many more times to run anything that looks like it regressed')
+    parser.add_argument('--save-baseline', action='store_true',   help='Save the results as the new baseline')
+    args = parser.parse_args()
+
+    cases = [(name,bench) for name,bench in allCases() if args.filter in name]
+
+    # Every round goes through all of them, so a slow patch on the machine doesn't land on just one
+    times: Dict[str, List[List[float]]] = {name:[] for name,_ in cases}
+    for _ in range(args.rounds):
+        for name,bench in cases:
+            times[name].append(bench())
+    results = {}
+    spreads = {}
+    for name,_ in cases:
+        results[name],spreads[name] = summarize(times[name])
+        print('{:<28} {:>10.2f}us  +/-{:.0%}'.format(name, results[name] * 1e6, spreads[name]), flush=True)
+
+    output = {
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'results':  results,
+        'spread':   spreads,
+    }
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+
+    if args.save_baseline:
+        # Keep anything that wasn't run this time
+        try:
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            baseline = {'results': {}}
+        baseline['python']   = output['python']
+        baseline['platform'] = output['platform']
+        baseline['results'].update(results)
+        baseline.setdefault('spread', {}).update(spreads)
+
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print('Saved baseline to {}'.format(args.baseline))
+        return
+
+    try:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print('No baseline at {}, run with --save-baseline to make one'.format(args.baseline))
+        return
+    baseline.setdefault('spread', {})
+
+    # Give anything that looks slower a few more chances before calling it a regression. Its best
+    # run only gets better with more runs, so a real slowdown still shows
+    benches = dict(cases)
+    for _ in range(args.confirm):
+        suspects = compare(results, spreads, baseline, args.tolerance, quiet=True)
+        if len(suspects) == 0:
+            break
+        print('Running {} again'.format(', '.join(suspects)), flush=True)
+        for name in suspects:
+            times[name].append(benches[name]())
+            results[name],spreads[name] = summarize(times[name])
+
+    regressions = compare(results, spreads, baseline, args.tolerance)
+    if len(regressions) > 0:
+        print()
+        print('{} benchmarks regressed: {}'.format(len(regressions), ', '.join(regressions)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import collections
+import disnake
+import lazy
+import re
+from typing import Dict,List,Optional
+
+# Every Unicode emoji, the first characters of them and the longest one. These are built from the
+# emoji package when it is loaded, see _buildIndex
+_emojis:      frozenset = frozenset()
+_firstChars:  frozenset = frozenset()
+_longest:     int       = 0
+
+def _buildIndex(module):
+    global _emojis, _firstChars, _longest
+    emojis = frozenset(module.EMOJI_DATA)
+    _firstChars = frozenset(e[0] for e in emojis)
+    _longest    = max(len(e) for e in emojis)
+    _emojis     = emojis
+
+# The emoji package has large tables that take a while to load, and is only needed for lines that
+# start with something that isn't ASCII. Call preload to load it in the background
+emoji = lazy.LazyModule('emoji', warm=_buildIndex)
+
+def preload():
+    emoji.preload()
+
+'''
+Finds the emojis that start the lines of a message, which is how RSVPs mark their special reacts.
+
+A line counts if, after any leading whitespace, it starts with either a Discord custom emoji like
+<:name:1234> or a Unicode emoji. Each emoji is only returned once, in the order they first show up.
+
+Custom emojis are found with a single regex anchored at the start of the line. Unicode emojis are
+found by looking up the start of the line in the set of every emoji the emoji package knows about,
+longest first, so a line costs a handful of dictionary lookups no matter how many emojis there are.
+Lines that start with ASCII are skipped without any of that, since no Unicode emoji we care about
+starts with an ASCII character.
+
+Results are kept for the most recently parsed messages, so parsing the same message again (like
+when it is saved without changes) is just a lookup.
+'''
+class EmojiParser():
+    # A custom emoji at the start of a line, or the first character of a line if it isn't ASCII
+    lineRegex = re.compile(r'(?:<:(\w+):(\d+)>|([^\x00-\x7f]))')
+
+    '''
+    cacheSize - How many messages to keep the results for. 0 turns off caching
+    '''
+    def __init__(self, cacheSize:int=256):
+        self.cacheSize = cacheSize
+        self.cache: 'collections.OrderedDict[str, tuple]' = collections.OrderedDict()
+
+        self.hits   = 0
+        self.misses = 0
+
+    '''
+    Returns the emojis starting the lines of the message, in the order they first show up
+    '''
+    def parse(self, body:str) -> List[disnake.PartialEmoji]:
+        if self.cacheSize > 0:
+            found = self.cache.get(body)
+            if found is not None:
+                self.cache.move_to_end(body)
+                self.hits += 1
+                return list(found)
+
+        found = tuple(self._parse(body))
+
+        if self.cacheSize > 0:
+            self.misses += 1
+            self.cache[body] = found
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+
+        return list(found)
+
+    def _parse(self, body:str) -> List[disnake.PartialEmoji]:
+        # Keyed by what the emoji is, so duplicates are dropped and the order is kept
+        found: Dict[object, disnake.PartialEmoji] = {}
+
+        for line in body.splitlines():
+            e = self.parseLine(line)
+            if e is not None:
+                found.setdefault(e.id if e.id is not None else e.name, e)
+
+        return list(found.values())
+
+    '''
+    Returns the emoji that starts the line, or None if it doesn't start with one
+    '''
+    def parseLine(self, line:str) -> Optional[disnake.PartialEmoji]:
+        line = line.lstrip()
+
+        matchObj = self.lineRegex.match(line)
+        if matchObj is None:
+            return None
+
+        if matchObj.group(2) is not None:
+            return disnake.PartialEmoji(animated=False, name=matchObj.group(1), id=int(matchObj.group(2)))
+
+        # Make sure the emojis are loaded, and that there could be one here before looking for it
+        emoji.load()
+        if line[0] not in _firstChars:
+            return None
+
+        for length in range(min(_longest, len(line)), 0, -1):
+            if line[:length] in _emojis:
+                return disnake.PartialEmoji(animated=False, name=line[:length], id=None)
+
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'size':   len(self.cache),
+            'hits':   self.hits,
+            'misses': self.misses,
+        }
@@ -1,6 +1,10 @@
 import asyncio
+import bisect
 import disnake
+import itertools
 import math
+import metrics
+import ratelimit
 from typing import Any,List,Dict,Tuple
 
 class ExtMessage():
@@ -17,6 +21,10 @@ class ExtMessage():
         self.msg    = msg
         self.msgObjs= []
 
+        # The content we last sent for each message. This is what edits are compared against, since
+        # the message objects are not updated when we edit them
+        self.rendered = []
+
         # See how many messages are required
         # We take the larger of the requested count or the message plus the reserved amount (to account)
         # for growth
@@ -31,17 +39,27 @@ class ExtMessage():
         # we set it to -1 to denote that it is invalid
         self.id = -1
 
+        # Optional callback for when the messages making up this object change. It is called with the
+        # list of message IDs that were added and the list that were removed. This lets the owner of
+        # the object (ie the reactTracker) keep lookups by message ID up to date
+        self.idCb = None
+
+        # Layout of the last split, so edits only redo the parts of the message that changed
+        self._layout = None
+
     def splitMessageLine(self, msg:str, length:int=None) -> List[str]:
         # Set the split length to the message default unless it has been specified
         if length is None:
             length = self.MAX_MSG_LEN
 
         splitMsg = []
-        newStr = ''
+        words = []
+        wordsLen = 0
 
         # Break down the line into phrases
         # We use whitespace as the delimiter to break a line up into words. Start building new lines word by
-        # word until they are just below the maximum line length, or if we're out of words
+        # word until they are just below the maximum line length, or if we're out of words. Each word is
+        # followed by a space
         # Note: This breaks down if there are no spaces in the message to split on
         for word in msg.split():
             # Couldn't split the line down below the length
@@ -52,150 +70,62 @@ class ExtMessage():
                     word, length))
 
             # Append the new maximally length line to the output as adding this word would exceed the max
-            if ((len(newStr) + len(word) + 1) > length):
-                splitMsg.append(newStr)
-                newStr = ''
+            if ((wordsLen + len(word) + 1) > length):
+                splitMsg.append(self._joinWords(words))
+                words = []
+                wordsLen = 0
 
             # Add the word to the line
-            newStr += word + ' '
-        else:
-            splitMsg.append(newStr)
+            words.append(word)
+            wordsLen += len(word) + 1
 
-        return splitMsg
-
-    def splitMessage(self) -> List[str]:
-        # Create blank messages based on how many messages we need to return
-        splitMsg = []
-        for _ in range(self.msgCnt):
-            splitMsg.append('')
-
-        # We first will try to split the message just by newlines and hope that this fits well
-        msgSplitByLine = self.msg.splitlines(keepends=True)
-
-        # Make sure none of the split lines are too big
-        # If the line is too long, we break it up to the limits
-        newMsgSplitByLine = []
-        for m in msgSplitByLine:
-            if (len(m) > self.MAX_MSG_LEN):
-                newMsgSplitByLine.extend(self.splitMessageLine(m))
-            else:
-                newMsgSplitByLine.append(m)
+        splitMsg.append(self._joinWords(words))
 
-        msgSplitByLine = newMsgSplitByLine
-
-        # There are a few special multiline blocks we may need to handle.
-        # The following are currently supported is discord:
-        # Code  Blocks: ``` / ```
-        # Quote Blocks: >>>
-        # Spoiler Tags:  || / ||
-        # We will only try to handle code blocks. The other two are too much of a pain to try
-        # to parse unless someone really wants them.
-        # To keep the block together, we will aggregate them into a single line "entry". Be aware
-        # that this can push it beyond the max length for poorly formed messages. We will just
-        # raise an exception rather than trying to rehandle it and insert multiple block entries
-        newMsgSplitByLine = []
-        inBlock = False
-        for m in msgSplitByLine:
-            # For code blocks, there can be multiple states where the code block starts/ends are in the same line. We end
-            # the lines bit by bit
-            if self.CODE_BLOCK in m:
-                remainingMsg = m
-                while (remainingMsg != ''):
-                    # Consume the start of the line before the block starts
-                    # Also start creating the aggregated block line with just the block start
-                    if ((not inBlock) and (self.CODE_BLOCK in remainingMsg)):
-                        blockPos = remainingMsg.find(self.CODE_BLOCK)
-
-                        if (remainingMsg[:blockPos] != ''):
-                            newMsgSplitByLine.append(remainingMsg[:blockPos])
-
-                        newStr       = self.CODE_BLOCK
-                        remainingMsg = remainingMsg[blockPos + len(self.CODE_BLOCK):]
-                        inBlock = True
-                    # In the block, and the end block is in the same line
-                    elif ((inBlock) and (self.CODE_BLOCK in remainingMsg)):
-                        blockPos = remainingMsg.find(self.CODE_BLOCK) + len(self.CODE_BLOCK)
-                        newStr  += remainingMsg[:blockPos]
-
-                        # The aggregated block can end up larger than the max character limit
-                        # This is a sanity check, but this doesn't actually fix anything
-                        if (len(newStr) > self.MAX_MSG_LEN):
-                            raise ValueError('Aggregated code block length ({}) exceeds MAX_MSG_LEN ({})'.format(
-                                len(newStr), self.MAX_MSG_LEN))
-
-                        # Add the block to it's own line
-                        newMsgSplitByLine.append(newStr)
-
-                        remainingMsg = remainingMsg[blockPos:]
-                        inBlock = False
-                    # In the block and no end of the block
-                    elif (inBlock):
-                        newStr += remainingMsg
-                        remainingMsg = ''
-                    # Not in block and no start of block
-                    else:
-                        if (remainingMsg[:blockPos] != ''):
-                            newMsgSplitByLine.append(remainingMsg)
-
-                        remainingMsg = ''
-
-            # We are in a block and there are no end markers
-            elif inBlock:
-                newStr += m
-
-            # We are not in a block
-            else:
-                newMsgSplitByLine.append(m)
+        return splitMsg
 
-        msgSplitByLine = newMsgSplitByLine
+    @staticmethod
+    def _joinWords(words:List[str]) -> str:
+        if len(words) == 0:
+            return ''
 
-        # Allocate lines to the messages.
-        # If there are less lines than messages try to fill from the bottom so that the text
-        # is closest to the message with reactions. Otherwise, greedily fill the messages from
-        # top to bottom
-        msgIdx = 0
-        for lineIdx,line in enumerate(msgSplitByLine):
-            while True:
-                remainingLines = len(msgSplitByLine) - lineIdx
-                remainingMsgs  = self.msgCnt - msgIdx
-
-                # To ensure later messages always have content, make sure there is excess content
-                # before we take one for this message
-                if (remainingLines >= remainingMsgs):
-                    break
-                else:
-                    msgIdx += 1
+        return ' '.join(words) + ' '
 
-            # Check if we have room in this message, or need to move onto the next message
-            if (len(splitMsg[msgIdx]) + len(line) > self.MAX_MSG_LEN):
-                # If this was the last message, raise an error
-                if (remainingMsgs == 0):
-                    raise ValueError('Out of characters across all messages for message')
-                else:
-                    msgIdx += 1
+    def splitMessage(self) -> List[str]:
+        # The layout remembers the last message it split, so we only need to redo the parts that changed
+        if self._layout is None:
+            self._layout = _splitLayout(self)
 
-            splitMsg[msgIdx] += line
+        return self._layout.split(self.msg, self.msgCnt)
 
-        # Fill all unused messages with blank strings
-        # This will also detect if a line is just whitespace and insert the blank string so that
-        # discord won't be annoyed at sending an "empty" message
-        for msg in range(self.msgCnt):
-            if ((splitMsg[msg] == '') or splitMsg[msg].isspace()):
-                splitMsg[msg] += self.BLANK_STR
+    '''
+    All the messages are in the same channel, so they share its rate limit
+    '''
+    @property
+    def limiter(self) -> ratelimit.Limiter:
+        return ratelimit.limiterFor(self.msgObjs[-1].channel.id)
 
-        return splitMsg
+    @property
+    def guildId(self) -> int:
+        return self.msgObjs[-1].guild.id
 
     async def create(self, channel):
         # Get all the messages we need
         messages = self.splitMessage()
 
         # Create the number of messages needed and store their objects
+        # These have to be sent one at a time so that they show up in order
         for i in range(self.msgCnt):
-            self.msgObjs.append(await channel.send(messages[i]))
+            with metrics.api('send', channel.guild.id):
+                self.msgObjs.append(await channel.send(messages[i]))
+
+        self.rendered = messages
 
         # The last object's ID is our ID
         self.id = self.msgObjs[-1].id
 
+        if self.idCb is not None:
+            self.idCb([m.id for m in self.msgObjs], [])
+
     async def edit(self, content:str):
         # Make sure the new message is not too long
         msgLen = len(content)
@@ -207,20 +137,41 @@ class ExtMessage():
         self.msg = content
         messages = self.splitMessage()
 
-        # Edit each message
-        # We compare the contents to the new strings and only edit if they differ. This is less for performance
-        # than to try to save the "edited" tag on the blank messages
-        for i in range(self.msgCnt):
-            if (self.msgObjs[i].content != messages[i]):
-                await self.msgObjs[i].edit(content=messages[i])
+        # Edit each message that changed at the same time
+        # We compare the contents to what we last sent and only edit if they differ. This is less for
+        # performance than to try to save the "edited" tag on the blank messages
+        if len(self.rendered) != self.msgCnt:
+            self.rendered = [None] * self.msgCnt
+
+        limiter = self.limiter
+        guildId = self.guildId
+
+        async def editPart(i):
+            async with limiter:
+                with metrics.api('edit', guildId):
+                    await self.msgObjs[i].edit(content=messages[i])
+            self.rendered[i] = messages[i]
+
+        await asyncio.gather(*[editPart(i) for i in range(self.msgCnt) if self.rendered[i] != messages[i]])
 
     async def delete(self, delay=None):
+        limiter = self.limiter
+        guildId = self.guildId
+
+        async def deletePart(m):
+            async with limiter:
+                with metrics.api('delete', guildId):
+                    await m.delete(delay=delay)
+
         # Delete each message
-        for i in range(self.msgCnt):
-            await self.msgObjs[i].delete(delay=delay)
+        await asyncio.gather(*[deletePart(m) for m in self.msgObjs])
+
+        if self.idCb is not None:
+            self.idCb([], [m.id for m in self.msgObjs])
 
         # Clear variables and IDs in case this object gets reused
         self.msgObjs = []
+        self.rendered = []
         self.id = -1
 
     async def publish(self):
@@ -238,20 +189,30 @@ class ExtMessage():
 
     async def add_reaction(self, emoji):
         # Only add reactions to the last message in the chain
-        await self.msgObjs[-1].add_reaction(emoji)
+        with metrics.api('add_reaction', self.guildId):
+            await self.msgObjs[-1].add_reaction(emoji)
 
     async def remove_reaction(self, emoji):
         # There should only be reactions on the last message in the chain
-        await self.msgObjs[-1].remove_reaction(emoji)
+        with metrics.api('remove_reaction', self.guildId):
+            await self.msgObjs[-1].remove_reaction(emoji)
 
     async def clear_reactions(self):
         # There should only be reactions on the last message in the chain
-        await self.msgObjs[-1].clear_reactions()
+        with metrics.api('clear_reactions', self.guildId):
+            await self.msgObjs[-1].clear_reactions()
 
     async def clean_reactions(self):
+        limiter = self.limiter
+        guildId = self.guildId
+
+        async def cleanPart(m):
+            async with limiter:
+                with metrics.api('clear_reactions', guildId):
+                    await m.clear_reactions()
+
         # Clears all reacts except on the last message
-        for m in self.msgObjs[:-1]:
-            await m.clear_reactions()
+        await asyncio.gather(*[cleanPart(m) for m in self.msgObjs[:-1]])
 
     def check_ids(self, id:int) -> bool:
         for m in self.msgObjs:
@@ -260,4 +221,349 @@ class ExtMessage():
 
         return False
 
+'''
+Where the first stage of splitting is in a code block
+'''
+class _blockState():
+    def __init__(self):
+        self.inBlock  = False
+        self.block    = []
+        self.blockLen = 0
+
+'''
+Splits an ExtMessage's text up into its messages, keeping enough state from the last split to
+only redo the work downstream of the first line that changed.
+
+Splitting happens in two stages. First the text is broken into lines, which are the smallest
+pieces that can be placed in a message. Lines that are too long are split by words, and code
+blocks are joined into a single line so that they aren't split across messages. Then the lines
+are placed into the messages in order.
+
+For the first stage we remember how many lines had been made before each line of the text. If
+the text is the same up to some line, and we weren't in the middle of a code block there, all
+the lines before it can be kept.
+
+For the second stage we remember the first line placed in each message. Placement depends on the
+total number of lines (to keep the last messages filled), so we check how far the old placement
+would still be the same with the new total, and restart from there. Messages made only of lines
+before the restart are reused as is.
+
+Neither stage builds strings as it goes. Lines without code blocks are taken as is in bulk, and
+lines are placed by searching running totals of their lengths. Each message is joined from its
+lines once at the end.
+'''
+class _splitLayout():
+    def __init__(self, ext:ExtMessage):
+        self.ext = ext
+
+        # Input and output of the last split
+        self.msg    = None
+        self.msgCnt = None
+        self.parts  = []
+
+        # rawLines  - The text split by newline
+        # rawStart  - For each raw line, the number of lines made before it, or None if that was in a code block
+        # lines     - The lines to place
+        # numLines  - The number of lines that were placed
+        # partStart - For each message, the first line placed in it
+        self.rawLines  = []
+        self.rawStart  = []
+        self.lines     = []
+        self.numLines  = 0
+        self.partStart = []
+
+    def split(self, msg:str, msgCnt:int) -> List[str]:
+        if (msg == self.msg) and (msgCnt == self.msgCnt):
+            return list(self.parts)
+
+        rawLines = msg.splitlines(keepends=True)
+
+        # Keep the layout if only the text changed, otherwise start over
+        if msgCnt == self.msgCnt:
+            rawSame = self._commonPrefix(self.rawLines, rawLines)
+        else:
+            rawSame = 0
+
+        # If something can't fit we don't know what state we were left in, so forget everything
+        try:
+            lineSame = self._tokenize(msg, rawLines, rawSame)
+            self._place(msgCnt, lineSame)
+        except:
+            self.__init__(self.ext)
+            raise
+
+        self.msg    = msg
+        self.msgCnt = msgCnt
+        return list(self.parts)
+
+    '''
+    Returns how many items at the start of the two lists are the same. Comparing slices is done
+    in C, so a binary search over them is much faster than comparing item by item
+    '''
+    @staticmethod
+    def _commonPrefix(old:List[str], new:List[str]) -> int:
+        lo = 0
+        hi = min(len(old), len(new))
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if old[lo:mid] == new[lo:mid]:
+                lo = mid
+            else:
+                hi = mid - 1
+
+        return lo
+
+    '''
+    First stage. Makes the lines to place, keeping everything made before the first of the raw lines
+    that changed. Returns how many lines were kept
+    '''
+    def _tokenize(self, msg:str, rawLines:List[str], rawSame:int) -> int:
+        CODE_BLOCK  = self.ext.CODE_BLOCK
+        MAX_MSG_LEN = self.ext.MAX_MSG_LEN
+
+        # Back up to a line that wasn't in a code block
+        # The entry after the last raw line (if we have it) tells us where the last block ended
+        restart = min(rawSame, len(self.rawStart) - 1)
+        while (restart > 0) and (self.rawStart[restart] is None):
+            restart -= 1
+
+        if restart < 0:
+            restart = 0
+            lineSame = 0
+        else:
+            lineSame = self.rawStart[restart]
+
+        rawStart = self.rawStart[:restart]
+        lines    = self.lines[:lineSame]
+
+        # Only raw lines with a code block marker in them, or that are too long, need to be looked at
+        # one by one. Find the code block markers in the text and work out which line they are in
+        rawCum = list(itertools.accumulate(map(len, rawLines), initial=0))
+        special = {i for i,l in enumerate(map(len, rawLines[restart:]), restart) if l > MAX_MSG_LEN}
+
+        pos = msg.find(CODE_BLOCK, rawCum[restart])
+        while pos >= 0:
+            special.add(bisect.bisect_right(rawCum, pos) - 1)
+            pos = msg.find(CODE_BLOCK, pos + len(CODE_BLOCK))
+
+        state = _blockState()
+        rawIdx = restart
+        for specialIdx in sorted(special) + [len(rawLines)]:
+            # Take all the plain lines before the next special one as is
+            plain = rawLines[rawIdx:specialIdx]
+            if state.inBlock:
+                rawStart.extend([None] * len(plain))
+                state.block.extend(plain)
+                state.blockLen += rawCum[specialIdx] - rawCum[rawIdx]
+            else:
+                rawStart.extend(range(len(lines), len(lines) + len(plain)))
+                lines.extend(plain)
+
+            if specialIdx == len(rawLines):
+                break
+
+            rawStart.append(None if state.inBlock else len(lines))
+            self._tokenizeLine(rawLines[specialIdx], lines, state)
+            rawIdx = specialIdx + 1
+
+        # Remember where things stood after the last raw line too, so appending to the text can
+        # keep everything
+        # Note: A code block that is never closed is dropped
+        rawStart.append(None if state.inBlock else len(lines))
+
+        self.rawLines = rawLines
+        self.rawStart = rawStart
+        self.lines    = lines
+
+        return lineSame
+
+    '''
+    Makes the lines for a single raw line that is too long or has a code block marker in it
+    '''
+    def _tokenizeLine(self, raw:str, lines:List[str], state:_blockState):
+        CODE_BLOCK  = self.ext.CODE_BLOCK
+        MAX_MSG_LEN = self.ext.MAX_MSG_LEN
+
+        # Make sure none of the split lines are too big
+        # If the line is too long, we break it up to the limits
+        if (len(raw) > MAX_MSG_LEN):
+            pieces = self.ext.splitMessageLine(raw)
+        else:
+            pieces = [raw]
+
+        # There are a few special multiline blocks we may need to handle.
+        # The following are currently supported is discord:
+        # Code  Blocks: ``` / ```
+        # Quote Blocks: >>>
+        # Spoiler Tags:  || / ||
+        # We will only try to handle code blocks. The other two are too much of a pain to try
+        # to parse unless someone really wants them.
+        # To keep the block together, we will aggregate them into a single line "entry". Be aware
+        # that this can push it beyond the max length for poorly formed messages. We will just
+        # raise an exception rather than trying to rehandle it and insert multiple block entries
+        for m in pieces:
+            # For code blocks, there can be multiple states where the code block starts/ends are in the same line. We end
+            # the lines bit by bit
+            pos = 0
+            while pos < len(m):
+                blockPos = m.find(CODE_BLOCK, pos)
+
+                # Not in block and no start of block
+                if (blockPos < 0) and (not state.inBlock):
+                    lines.append(m[pos:])
+                    break
+
+                # In the block and no end of the block
+                elif (blockPos < 0):
+                    state.block.append(m[pos:])
+                    state.blockLen += len(m) - pos
+                    break
+
+                # Consume the start of the line before the block starts
+                # Also start creating the aggregated block line with just the block start
+                elif (not state.inBlock):
+                    if (blockPos > pos):
+                        lines.append(m[pos:blockPos])
+
+                    state.block    = [CODE_BLOCK]
+                    state.blockLen = len(CODE_BLOCK)
+                    state.inBlock  = True
+                    pos = blockPos + len(CODE_BLOCK)
+
+                # In the block, and the end block is in the same line
+                else:
+                    blockEnd = blockPos + len(CODE_BLOCK)
+                    state.block.append(m[pos:blockEnd])
+                    state.blockLen += blockEnd - pos
+
+                    # The aggregated block can end up larger than the max character limit
+                    # This is a sanity check, but this doesn't actually fix anything
+                    if (state.blockLen > MAX_MSG_LEN):
+                        raise ValueError('Aggregated code block length ({}) exceeds MAX_MSG_LEN ({})'.format(
+                            state.blockLen, MAX_MSG_LEN))
+
+                    # Add the block to it's own line
+                    lines.append(''.join(state.block))
+                    state.inBlock = False
+                    pos = blockEnd
+
+    '''
+    Second stage. Places the lines into the messages, keeping the placement of lines before
+    the first line that changed if it would still be the same
+    '''
+    def _place(self, msgCnt:int, lineSame:int):
+        MAX_MSG_LEN = self.ext.MAX_MSG_LEN
+        lines    = self.lines
+        numLines = len(lines)
+
+        # Line i can't be placed before message (skip + i), so that there is a line left for every
+        # message after it
+        skip = msgCnt - numLines
+
+        keep = self._keepPlacement(msgCnt, skip, lineSame)
+
+        # Pick up where the last kept line left off
+        lineCum = list(itertools.accumulate(map(len, lines), initial=0))
+        if keep > 0:
+            msgIdx    = bisect.bisect_right(self.partStart, keep - 1) - 1
+            partStart = self.partStart[:msgIdx + 1]
+        else:
+            msgIdx    = 0
+            partStart = [0]
+        curLen = lineCum[keep] - lineCum[partStart[msgIdx]]
+
+        # Messages before the one the last kept line is in are made of only kept lines, so they are
+        # the same as before
+        keptParts = msgIdx
+
+        # Allocate lines to the messages.
+        # If there are less lines than messages try to fill from the bottom so that the text
+        # is closest to the message with reactions. Otherwise, greedily fill the messages from
+        # top to bottom
+        lineIdx = keep
+        while lineIdx < numLines:
+            # To ensure later messages always have content, make sure there is excess content
+            # before we take one for this message
+            if skip + lineIdx > msgIdx:
+                msgIdx = skip + lineIdx
+                curLen = 0
+
+            # Take as many lines as fit in this message, and that don't need to skip ahead
+            fitIdx = bisect.bisect_right(lineCum, lineCum[lineIdx] + MAX_MSG_LEN - curLen, lineIdx + 1) - 1
+            endIdx = min(fitIdx, msgIdx - skip + 1, numLines)
+
+            # If not even the next line fits, we need to move onto the next message
+            if endIdx == lineIdx:
+                # If this was the last message, raise an error
+                if (msgIdx + 1 >= msgCnt):
+                    raise ValueError('Out of characters across all messages for message')
 
+                msgIdx += 1
+                curLen = 0
+                endIdx = lineIdx + 1
+
+            # Messages we skipped over are empty
+            while len(partStart) < msgIdx + 1:
+                partStart.append(lineIdx)
+
+            curLen += lineCum[endIdx] - lineCum[lineIdx]
+            lineIdx = endIdx
+
+        # Every message after the last one used is empty
+        while len(partStart) < msgCnt:
+            partStart.append(numLines)
+
+        # Build the messages out of their lines
+        parts = self.parts[:keptParts]
+        for msgIdx in range(keptParts, msgCnt):
+            start = partStart[msgIdx]
+            end   = partStart[msgIdx + 1] if msgIdx + 1 < msgCnt else numLines
+
+            part = ''.join(lines[start:end])
+
+            # Fill all unused messages with blank strings
+            # This will also detect if a line is just whitespace and insert the blank string so that
+            # discord won't be annoyed at sending an "empty" message
+            if ((part == '') or part.isspace()):
+                part += self.ext.BLANK_STR
+
+            parts.append(part)
+
+        self.numLines  = numLines
+        self.partStart = partStart
+        self.parts     = parts
+
+    '''
+    Works out how many of the lines at the start would be placed the same as last time
+    '''
+    def _keepPlacement(self, msgCnt:int, skip:int, lineSame:int) -> int:
+        if (msgCnt != self.msgCnt) or (lineSame == 0):
+            return 0
+
+        # Placing line j starts from the message that line j-1 was placed in (or the first message),
+        # and skips ahead to (skip + j) if that is further along. If the number of lines changed,
+        # placing it only stays the same if it didn't skip ahead either last time or now
+        oldSkip = msgCnt - self.numLines
+        if oldSkip == skip:
+            return lineSame
+
+        maxSkip = max(skip, oldSkip)
+        if maxSkip > 0:
+            return 0
+
+        partStart = self.partStart
+        for msgIdx in range(msgCnt):
+            start = partStart[msgIdx]
+            end   = partStart[msgIdx + 1] if msgIdx + 1 < msgCnt else self.numLines
+
+            # The lines after the lines in this message start from this message
+            if (start == end):
+                continue
+            if (start + 1 >= lineSame):
+                break
+
+            first = max(start + 1, msgIdx - maxSkip + 1)
+            if first < min(end + 1, lineSame):
+                return first
+
+        return lineSame
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import os
+from typing import Any,Callable,Dict,List
+
+'''
+A durable, append-only log of changes to tracked items.
+
+Every change is written as a single compact JSON line. Lines are buffered in memory and written out
+and fsync'd in batches from a background task (off the event loop), so recording a change is cheap.
+The log is periodically compacted by writing a snapshot of the full state and starting a new log.
+
+Every record has a sequence number and the snapshot stores the last sequence number it includes.
+Records at or below that are skipped during replay, so crashing between writing a snapshot and
+truncating the log doesn't apply anything twice.
+
+Records are dictionaries with the following fields:
+s         - Sequence number
+t         - Record type, one of the below
+id        - The ID the tracked item is stored under
+
+Record types:
+c         - Tracked item created. d is the encoded Tracker
+a         - Entry added. e is the encoded trackerEntry
+i         - Entry invalidated. n is the index of the entry
+x         - Expiration changed. x is the new expiration timestamp
+m         - Message changed. m is the new message
+d         - Tracked item deleted or expired
+'''
+class Journal():
+    def __init__(self, journalFile:str, snapshotFile:str, syncInterval:float=1.0, compactRecords:int=10000):
+        self.journalFile    = journalFile
+        self.snapshotFile   = snapshotFile
+        self.syncInterval   = syncInterval
+        self.compactRecords = compactRecords
+
+        self.seq        = 0
+        self.pending    = []
+        self.logRecords = 0
+        self.fd         = None
+
+        # Only one thing can write to the files at once
+        self.lock = asyncio.Lock()
+
+    '''
+    Adds a record to the log. The record is durable once the next sync finishes
+    '''
+    def append(self, rType:str, itemId:int, **fields):
+        self.seq += 1
+
+        rec = {'s': self.seq, 't': rType, 'id': itemId}
+        rec.update(fields)
+
+        self.pending.append(json.dumps(rec, separators=(',', ':')))
+
+    '''
+    Applies a single record to a state of encoded trackers
+    '''
+    @staticmethod
+    def apply(state:Dict[int, Dict[str, Any]], rec:Dict[str, Any]):
+        rType  = rec['t']
+        itemId = rec['id']
+
+        if rType == 'c':
+            state[itemId] = rec['d']
+            return
+
+        item = state.get(itemId)
+        if item is None:
+            return
+
+        if rType == 'a':
+            item['entries'].append(rec['e'])
+        elif rType == 'i':
+            item['entries'][rec['n']]['valid'] = False
+        elif rType == 'x':
+            item['expire'] = rec['x']
+        elif rType == 'm':
+            item['msg'] = rec['m']
+        elif rType == 'd':
+            state.pop(itemId)
+
+    '''
+    Rebuilds the state of encoded trackers from the last snapshot and the log since then.
+    This also opens the log for writing, so it must be called before anything is synced
+    '''
+    def replay(self) -> Dict[int, Dict[str, Any]]:
+        state = {}
+        seq   = 0
+
+        try:
+            with open(self.snapshotFile, 'r') as f:
+                snapshot = json.load(f)
+            seq   = snapshot['seq']
+            state = {int(k):v for k,v in snapshot['items'].items()}
+        except FileNotFoundError:
+            pass
+
+        records = 0
+        goodLen = 0
+        try:
+            with open(self.journalFile, 'rb') as f:
+                for line in f:
+                    # The last line may be partially written if we crashed. Anything after it is lost
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+
+                    records += 1
+                    goodLen += len(line)
+                    if rec['s'] <= seq:
+                        continue
+
+                    self.apply(state, rec)
+                    seq = rec['s']
+        except FileNotFoundError:
+            pass
+
+        self.seq        = seq
+        self.logRecords = records
+
+        # Cut off any partially written record, otherwise new records would be appended onto it
+        self.fd = os.open(self.journalFile, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        os.ftruncate(self.fd, goodLen)
+
+        return state
+
+    '''
+    Writes out and fsyncs everything that has been appended. Returns True if the log is big enough
+    that it should be compacted
+    '''
+    async def sync(self) -> bool:
+        async with self.lock:
+            # Everything was saved when it was closed
+            if self.fd is None:
+                return False
+
+            if len(self.pending) > 0:
+                data = ('\n'.join(self.pending) + '\n').encode()
+                self.logRecords += len(self.pending)
+                self.pending = []
+
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+        return self.logRecords >= self.compactRecords
+
+    def _write(self, data:bytes):
+        os.write(self.fd, data)
+        os.fsync(self.fd)
+
+    '''
+    Writes a snapshot of the full state and starts a new log. getState is called once nothing
+    else is writing, and must return the encoded state including everything appended so far
+    '''
+    async def snapshot(self, getState:Callable[[], Dict[int, Dict[str, Any]]]):
+        async with self.lock:
+            if self.fd is None:
+                return
+
+            # Anything still pending is already part of the state
+            self.pending = []
+            data = json.dumps({'seq': self.seq, 'items': getState()}, separators=(',', ':')).encode()
+
+            await asyncio.get_running_loop().run_in_executor(None, self._writeSnapshot, data)
+            self.logRecords = 0
+
+    def _writeSnapshot(self, data:bytes):
+        # Write the snapshot to the side and then swap it in so there is always a complete one
+        tmpFile = self.snapshotFile + '.tmp'
+        with open(tmpFile, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpFile, self.snapshotFile)
+
+        # The rename isn't durable until the directory is, and losing it after the log is thrown away
+        # would lose everything since the last snapshot
+        _fsyncDir(os.path.dirname(os.path.abspath(self.snapshotFile)))
+
+        # Now that the snapshot covers everything, the log can be thrown away
+        os.close(self.fd)
+        self.fd = os.open(self.journalFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND)
+        os.fsync(self.fd)
+
+    '''
+    Closes the log. Anything appended after the last sync is lost, so sync or snapshot first
+    '''
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+'''
+Flushes a directory's entries, like renames in it, to disk
+'''
+def _fsyncDir(path:str):
+    # Windows can't open directories, and makes renames durable on its own
+    if os.name == 'nt':
+        return
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
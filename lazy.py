@@ -0,0 +1,46 @@
+import importlib
+import threading
+from typing import Any,Callable
+
+'''
+A module that isn't imported until it is first used.
+
+Attributes are looked up on the module, importing it if it hasn't been yet, so this can be used in
+place of the module itself:
+    emoji = lazy.LazyModule('emoji')
+    emoji.emoji_list(line)
+
+preload imports it on a background thread instead, so it is usually ready by the time it is needed
+without holding up startup. warm is called with the module once it is imported, for anything else
+that should be done ahead of time, like building caches the module builds on first use.
+'''
+class LazyModule():
+    def __init__(self, name:str, warm:Callable[[Any], None]=None):
+        self._name   = name
+        self._warm   = warm
+        self._module = None
+        self._lock   = threading.Lock()
+
+    def load(self):
+        module = self._module
+        if module is not None:
+            return module
+
+        # Whoever gets here first does the import, anyone else waits for it
+        with self._lock:
+            if self._module is None:
+                module = importlib.import_module(self._name)
+                if self._warm is not None:
+                    self._warm(module)
+                self._module = module
+            return self._module
+
+    '''
+    Starts importing the module on a background thread, if it hasn't been already
+    '''
+    def preload(self):
+        if self._module is None:
+            threading.Thread(target=self.load, name='preload-' + self._name, daemon=True).start()
+
+    def __getattr__(self, attr:str):
+        return getattr(self.load(), attr)
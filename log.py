@@ -0,0 +1,155 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Any,Dict
+
+'''
+Logging for the bot.
+
+Everything logs through the standard logging module, but records are only put on a queue by the
+thread that logs them. A background thread takes them off the queue and does the actual writing,
+so the event loop never waits on stdout or a file no matter how slow they are.
+
+Messages that come in floods (like one for every reaction) are rate limited. Each message is only
+let through burst times every interval seconds, and the next one that is let through says how many
+were dropped. Messages are told apart by their logger and format string, not their arguments, so
+the same message about different items counts as the same message.
+
+Extra fields can be attached to a record for the structured output:
+    logger.info('Created an RSVP', extra=log.fields(msgId=msgObj.id))
+'''
+
+# Everything in the bot logs under this, so it can be configured separately from the libraries
+ROOT = 'lolotron'
+
+_listener = None
+
+def getLogger(name:str) -> logging.Logger:
+    return logging.getLogger('{}.{}'.format(ROOT, name))
+
+def fields(**kwargs) -> Dict[str, Any]:
+    return {'fields': kwargs}
+
+'''
+Drops messages that are logged more than burst times in interval seconds
+'''
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst:int=20, interval:float=60.0):
+        super().__init__()
+        self.burst    = burst
+        self.interval = interval
+
+        # (logger, message) -> [window start, count in window, dropped]
+        self.windows = {}
+
+    def filter(self, record:logging.LogRecord) -> bool:
+        now = time.monotonic()
+        key = (record.name, record.msg)
+
+        window = self.windows.get(key)
+        if (window is None) or (now - window[0] >= self.interval):
+            dropped = 0 if window is None else window[2]
+            window = [now, 0, 0]
+            self.windows[key] = window
+
+            # Forget about messages that haven't been seen in a while
+            if len(self.windows) > 10000:
+                self.windows = {k:v for k,v in self.windows.items() if now - v[0] < self.interval}
+                self.windows[key] = window
+        else:
+            dropped = 0
+
+        window[1] += 1
+        if window[1] > self.burst:
+            window[2] += 1
+            return False
+
+        # Let the first message through a new window report what the last one dropped
+        if dropped > 0:
+            record.dropped = dropped
+        return True
+
+'''
+Writes a record as a single line of text, with any extra fields on the end as key=value
+'''
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, record:logging.LogRecord) -> str:
+        line = super().format(record)
+
+        extra = dict(getattr(record, 'fields', {}))
+        if hasattr(record, 'dropped'):
+            extra['dropped'] = record.dropped
+        if len(extra) > 0:
+            line += ' ' + ' '.join('{}={}'.format(k, v) for k,v in extra.items())
+
+        return line
+
+'''
+Writes a record as a single line of JSON
+'''
+class JsonFormatter(logging.Formatter):
+    def format(self, record:logging.LogRecord) -> str:
+        out = {
+            'time':   self.formatTime(record),
+            'level':  record.levelname,
+            'logger': record.name,
+            'msg':    record.getMessage(),
+        }
+        out.update(getattr(record, 'fields', {}))
+        if hasattr(record, 'dropped'):
+            out['dropped'] = record.dropped
+        if record.exc_info:
+            out['exc'] = self.formatException(record.exc_info)
+
+        return json.dumps(out, default=str)
+
+'''
+Sets up logging from the settings. This should be called once at startup, before anything logs.
+
+Settings are as follows (all optional):
+level     - The lowest level to log for the bot. Defaults to INFO
+libLevel  - The lowest level to log for libraries, like disnake. Defaults to WARNING
+format    - Either text or json. Defaults to text
+file      - A file to append to instead of writing to stdout
+burst     - How many times a message can be logged in an interval. Defaults to 20
+interval  - Seconds in a rate limit interval. Defaults to 60
+'''
+def setup(settings:Dict[str, Any]=None):
+    global _listener
+
+    settings = {} if settings is None else settings
+
+    if settings.get('file') is not None:
+        handler = logging.FileHandler(settings['file'], encoding='utf-8')
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if settings.get('format') == 'json' else TextFormatter())
+
+    # The filter is on the queue side so dropped messages never make it onto the queue
+    logQueue = queue.SimpleQueue()
+    queueHandler = logging.handlers.QueueHandler(logQueue)
+    queueHandler.addFilter(RateLimitFilter(settings.get('burst', 20), settings.get('interval', 60.0)))
+
+    root = logging.getLogger()
+    root.handlers = [queueHandler]
+    root.setLevel(settings.get('libLevel', 'WARNING'))
+    logging.getLogger(ROOT).setLevel(settings.get('level', 'INFO'))
+
+    _listener = logging.handlers.QueueListener(logQueue, handler, respect_handler_level=True)
+    _listener.start()
+
+'''
+Writes out everything still on the queue and stops the background thread
+'''
+def shutdown():
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
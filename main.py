@@ -1,19 +1,29 @@
+# Startup is timed in phases and reported once we're connected, so slow restarts can be tracked
+# down. This has to be first so the imports are counted
+import time
+startupMark = time.perf_counter()
+startupPhases = []
+
+def endPhase(name:str):
+    global startupMark
+    now = time.perf_counter()
+    startupPhases.append((name, now - startupMark))
+    startupMark = now
+
 # External Libraries
-import asyncio
-from collections import namedtuple
-from dataclasses import dataclass
-from datetime import datetime, timedelta
+import argparse
 import disnake
 import disnake.ext.commands as dxc
 import json
-import sys
-import time
-from typing import Any,Dict,List,Tuple
 
 # Internal Libraries
+import log
+import metrics
 import tracker
 import rsvp
 
+endPhase('imports')
+
 # Discord is now requiring us to declare the events we want
 # This enables the following:
 #   guilds, guild_messages, guild_reactions
@@ -34,21 +44,54 @@ clientIntents.typing = False
 clientIntents.voice_states = False
 clientIntents.webhooks = False
 
+logger = log.getLogger('main')
+
+# Give the Cogs a chance to write out anything in flight before we disconnect
+class lolotronBase():
+    async def close(self):
+        reactTracker = self.get_cog('reactTracker')
+        if reactTracker is not None:
+            await reactTracker.shutdown()
+
+        await super().close()
+
+class lolotronBot(lolotronBase, dxc.Bot):
+    pass
+
+# For when we are one of several processes that each run some of the shards
+class lolotronShardedBot(lolotronBase, dxc.AutoShardedBot):
+    pass
+
+# When run by the supervisor, we are only given some of the shards. Discord sends everything for
+# a guild (including its commands and reactions) to the shard it is on, so there is nothing else
+# to route. See supervisor.py
+parser = argparse.ArgumentParser(description='Runs the bot')
+parser.add_argument('--shard-ids',   default=None, help='Comma separated shards to run, for sharded mode')
+parser.add_argument('--shard-count', type=int, default=None, help='Total number of shards across all processes')
+parser.add_argument('--worker',      type=int, default=0, help='Which of the processes this is, for sharded mode')
+args = parser.parse_args()
+
 # We need to create the client early so that we can override a lot of the functions
 # internally. This version is the Bot version so we have access to command parsing
-client = dxc.Bot(command_prefix='%', description='', max_messages=None, intents=clientIntents)
+if args.shard_ids is not None:
+    client = lolotronShardedBot(command_prefix='%', description='', max_messages=None, intents=clientIntents,
+                                shard_ids=[int(s) for s in args.shard_ids.split(',')], shard_count=args.shard_count)
+else:
+    client = lolotronBot(command_prefix='%', description='', max_messages=None, intents=clientIntents)
 
 # Initial setup to know that things have worked
 @client.event
 async def on_ready():
-    print('*' * 80)
-    print('Should be ready to go now.')
-    print('I am: {:s}'.format(client.user.name))
-    print('*' * 80)
+    # This is called again after reconnecting, but only the first time is part of starting up
+    if (len(startupPhases) > 0) and (startupPhases[-1][0] != 'connect'):
+        endPhase('connect')
+        for name,seconds in startupPhases:
+            metrics.observe('startup_phase', seconds, phase=name)
+        logger.info('Started in %.2fs (%s)', sum(s for _,s in startupPhases),
+                    ', '.join('{} {:.0f}ms'.format(n, s * 1e3) for n,s in startupPhases))
 
-    print('I am connected to the following servers:')
-    for g in client.guilds:
-        print(g.name)
+    logger.info('Should be ready to go now. I am: %s', client.user.name)
+    logger.info('I am connected to the following servers: %s', ', '.join(g.name for g in client.guilds))
 
 ###############################################################################
 # Load General Settings
@@ -61,14 +104,26 @@ with open('lolotron_config.json', 'r') as f:
 
 token = genSettings['general']['token']
 
+# Logging goes through a background thread, so this has to be done before anything logs
+log.setup(genSettings.get('logging'))
+endPhase('config')
+
 ###############################################################################
 # Time to start everything. We never return from here, so make sure everything
 # is setup above this line
 ###############################################################################
 
-print('Loading modules')
+logger.info('Loading modules')
 client.add_cog(tracker.reactTracker(bot=client, settings=genSettings['tracker']))
 client.add_cog(rsvp.rsvp(bot=client, settings=genSettings['rsvp']))
-print('Starting to run')
+
+# The metrics endpoint is only started if it has been configured. Each process in sharded mode
+# gets the next port along
+if 'metrics' in genSettings:
+    client.loop.create_task(metrics.registry.serve(host=genSettings['metrics'].get('host', '127.0.0.1'),
+                                                   port=genSettings['metrics'].get('port', 9100) + args.worker))
+endPhase('cogs')
+logger.info('Starting to run')
 client.run(token)
-print('Should be done, exiting')
\ No newline at end of file
+logger.info('Should be done, exiting')
+log.shutdown()
\ No newline at end of file
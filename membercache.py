@@ -0,0 +1,180 @@
+import asyncio
+from collections import OrderedDict
+import disnake
+import log
+import metrics
+import time
+from typing import Any,Dict,Iterable,Tuple
+
+logger = log.getLogger('membercache')
+
+'''
+Members that have been asked for but not looked up yet for a single guild in the MemberCache
+'''
+class _pendingLookup():
+    def __init__(self):
+        self.userIds = set()
+        self.done    = asyncio.get_running_loop().create_future()
+
+'''
+A cache of guild members for display, looked up by (guild ID, user ID).
+
+Members are kept for ttl seconds, and the least recently used ones are thrown out once there are
+more than maxSize. Users that aren't in the guild anymore are remembered for negativeTtl seconds
+so we don't keep asking Discord about them.
+
+Members that aren't cached are looked up in batches. Everything that misses within batchDelay
+seconds of the first miss for a guild is looked up together, up to QUERY_MAX users per request.
+This uses the gateway member query, which works for specific users without the members intent.
+
+The following are kept for monitoring:
+hits      - Lookups that were answered from the cache, including departed users
+misses    - Lookups that had to go out to Discord
+queries   - Requests made to Discord
+'''
+class MemberCache():
+    # The most users Discord will look up in one request
+    QUERY_MAX = 100
+
+    def __init__(self, ttl:float=3600.0, negativeTtl:float=300.0, maxSize:int=5000, batchDelay:float=0.05):
+        self.ttl         = ttl
+        self.negativeTtl = negativeTtl
+        self.maxSize     = maxSize
+        self.batchDelay  = batchDelay
+
+        # (guild ID, user ID) -> (expiration, member or None if they aren't in the guild)
+        self.entries: OrderedDict[Tuple[int, int], Tuple[float, Any]] = OrderedDict()
+        self.pending: Dict[int, _pendingLookup] = {}
+
+        self.hits    = 0
+        self.misses  = 0
+        self.queries = 0
+
+    '''
+    Looks up a member in the cache. Returns whether the user was found, and the member. The member
+    is None if the user is known to not be in the guild
+    '''
+    def get(self, guildId:int, userId:int) -> Tuple[bool, Any]:
+        key = (guildId, userId)
+        entry = self.entries.get(key)
+        if entry is None:
+            return False,None
+
+        if entry[0] < time.monotonic():
+            self.entries.pop(key)
+            return False,None
+
+        self.entries.move_to_end(key)
+        return True,entry[1]
+
+    '''
+    Adds or refreshes a member
+    '''
+    def put(self, guildId:int, user:disnake.abc.User):
+        self._store((guildId, user.id), user, self.ttl)
+
+    '''
+    Remembers that a user isn't in the guild
+    '''
+    def putMissing(self, guildId:int, userId:int):
+        self._store((guildId, userId), None, self.negativeTtl)
+
+    def _store(self, key:Tuple[int, int], user, ttl:float):
+        self.entries[key] = (time.monotonic() + ttl, user)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    '''
+    Looks up the members with the user IDs. Users that aren't in the guild, or that couldn't be
+    looked up, are left out
+    '''
+    async def resolve(self, guild:disnake.Guild, userIds:Iterable[int]) -> Dict[int, disnake.abc.User]:
+        users   = {}
+        missing = []
+        for uid in userIds:
+            found,user = self.get(guild.id, uid)
+            if not found:
+                # The client may have the member even if we don't
+                user = guild.get_member(uid)
+                if user is not None:
+                    self.put(guild.id, user)
+                    found = True
+
+            if found:
+                self.hits += 1
+                if user is not None:
+                    users[uid] = user
+            else:
+                missing.append(uid)
+
+        if len(missing) == 0:
+            return users
+
+        self.misses += len(missing)
+        await asyncio.shield(self._lookup(guild, missing))
+
+        # Anything that still isn't cached couldn't be looked up, so leave it out this time
+        for uid in missing:
+            found,user = self.get(guild.id, uid)
+            if user is not None:
+                users[uid] = user
+
+        return users
+
+    '''
+    Joins the batch of lookups for the guild, starting one if there isn't one, and waits for it
+    '''
+    def _lookup(self, guild:disnake.Guild, userIds:Iterable[int]) -> asyncio.Future:
+        batch = self.pending.get(guild.id)
+        if batch is None:
+            batch = _pendingLookup()
+            self.pending[guild.id] = batch
+            asyncio.get_running_loop().create_task(self._runLookup(guild, batch))
+
+        batch.userIds.update(userIds)
+        return batch.done
+
+    async def _runLookup(self, guild:disnake.Guild, batch:_pendingLookup):
+        try:
+            # Give the rest of the burst a chance to join in
+            await asyncio.sleep(self.batchDelay)
+            self.pending.pop(guild.id)
+
+            userIds = list(batch.userIds)
+            for i in range(0, len(userIds), self.QUERY_MAX):
+                chunk = userIds[i:i + self.QUERY_MAX]
+
+                self.queries += 1
+                try:
+                    with metrics.api('query_members', guild.id):
+                        members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+                except (asyncio.TimeoutError, disnake.ClientException) as e:
+                    # Don't remember anyone as missing, we just don't know
+                    logger.warning('Lookup of %d members in %s failed: %s', len(chunk), guild.id, e)
+                    continue
+
+                for m in members:
+                    self.put(guild.id, m)
+
+                # Anyone that didn't come back isn't in the guild anymore
+                found = {m.id for m in members}
+                for uid in chunk:
+                    if uid not in found:
+                        self.putMissing(guild.id, uid)
+        finally:
+            if self.pending.get(guild.id) is batch:
+                self.pending.pop(guild.id)
+            batch.done.set_result(None)
+
+    '''
+    A summary of the cache for monitoring
+    '''
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'size':    len(self.entries),
+            'hits':    self.hits,
+            'misses':  self.misses,
+            'queries': self.queries,
+        }
@@ -0,0 +1,287 @@
+import asyncio
+import bisect
+import log
+import time
+from typing import Any,Callable,Dict,Iterable,List,Tuple
+
+logger = log.getLogger('metrics')
+
+'''
+Upper bounds, in seconds, of the histogram buckets. This covers everything from a dictionary lookup
+to a rate limited Discord call
+'''
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Everything we export is prefixed with this so it doesn't run into anything else being scraped
+PREFIX = 'lolotron_'
+
+'''
+A histogram of durations. counts[i] is how many were at or below BUCKETS[i], and the last count
+is everything above the last bucket.
+
+Observations are only put in their buckets when the histogram is read, or once enough of them
+have built up, since a lot more of them are made than are ever looked at. Call fold before reading
+'''
+class _histogram():
+    # How many observations can build up before they are put in their buckets
+    PENDING_MAX = 256
+
+    def __init__(self):
+        self.counts  = [0] * (len(BUCKETS) + 1)
+        self.sum     = 0.0
+        self.count   = 0
+        self.pending = []
+
+    def observe(self, value:float):
+        self.pending.append(value)
+        if len(self.pending) >= self.PENDING_MAX:
+            self.fold()
+
+    '''
+    Puts everything that has been observed so far in its bucket
+    '''
+    def fold(self):
+        pending = self.pending
+        if len(pending) == 0:
+            return
+
+        self.pending = []
+        for value in pending:
+            self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum   += sum(pending)
+        self.count += len(pending)
+
+    '''
+    Estimates the value at the fraction of observations, from the buckets
+    '''
+    def quantile(self, q:float) -> float:
+        self.fold()
+        if self.count == 0:
+            return 0.0
+
+        target = q * self.count
+        seen = 0
+        for i,c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+        return float('inf')
+
+'''
+Times a block of code into a histogram, and counts it as an error if it raises. This works around
+awaits just as well, since it only looks at the clock when entering and leaving
+'''
+class _span():
+    # Spans are made for every reaction, so keep them small
+    __slots__ = ('registry', 'name', 'labels', 'hist', 'start')
+
+    def __init__(self, registry:'Registry', name:str, labels:Tuple[Tuple[str, str], ...], hist:_histogram):
+        self.registry = registry
+        self.name     = name
+        self.labels   = labels
+        self.hist     = hist
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pending = self.hist.pending
+        pending.append(time.perf_counter() - self.start)
+        if len(pending) >= _histogram.PENDING_MAX:
+            self.hist.fold()
+        if exc_type is not None:
+            self.registry._inc(self.name + '_errors', self.labels, 1)
+
+'''
+Counters and histograms, split up by labels.
+
+Labels are passed as keyword arguments and are what the values are broken down by, like the guild
+or the Cog. Anything that is None is left out. Values that are already kept somewhere else can be
+exported as gauges by adding a collector, which is called every time the metrics are read and
+returns (name, labels, value) tuples.
+'''
+class Registry():
+    def __init__(self):
+        self.counters:   Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], _histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]] = []
+
+        # The labels and histogram for each span, by name and the labels as they were passed. Spans
+        # are on the hot path, so this saves formatting the labels and finding the histogram every time
+        self.spans: Dict[Tuple[str, Tuple], Tuple[Tuple, _histogram]] = {}
+
+    @staticmethod
+    def _labels(labels:Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+        return tuple(sorted((k, str(v)) for k,v in labels.items() if v is not None))
+
+    '''
+    Adds to a counter
+    '''
+    def inc(self, name:str, value:float=1, **labels):
+        self._inc(name, self._labels(labels), value)
+
+    def _inc(self, name:str, labels:Tuple, value:float):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    '''
+    Records a duration in seconds
+    '''
+    def observe(self, name:str, seconds:float, **labels):
+        self._observe(name, self._labels(labels), seconds)
+
+    def _observe(self, name:str, labels:Tuple, seconds:float):
+        self._histogram(name, labels).observe(seconds)
+
+    def _histogram(self, name:str, labels:Tuple) -> _histogram:
+        key = (name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            hist = _histogram()
+            self.histograms[key] = hist
+        return hist
+
+    '''
+    Times a block of code. Usage:
+        with registry.span('render', guild=guild.id, cog='rsvp'):
+            await render()
+    '''
+    def span(self, name:str, **labels) -> _span:
+        key = (name, tuple(labels.items()))
+        found = self.spans.get(key)
+        if found is None:
+            fmt = self._labels(labels)
+            found = (fmt, self._histogram(name, fmt))
+            self.spans[key] = found
+
+        return _span(self, name, found[0], found[1])
+
+    def addCollector(self, collector:Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]):
+        self.collectors.append(collector)
+
+    def _gauges(self) -> List[Tuple[str, Tuple, float]]:
+        gauges = []
+        for c in self.collectors:
+            try:
+                for name,labels,value in c():
+                    gauges.append((name, self._labels(labels), value))
+            except Exception:
+                logger.exception('Metrics collector failed')
+        return gauges
+
+    '''
+    Everything in the Prometheus text format
+    '''
+    def render(self) -> str:
+        def fmtLabels(labels, extra=()):
+            labels = labels + extra
+            if len(labels) == 0:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k,v in labels) + '}'
+
+        lines = []
+        typed = set()
+        def addType(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name,labels),value in sorted(self.counters.items()):
+            full = PREFIX + name + '_total'
+            addType(full, 'counter')
+            lines.append('{}{} {}'.format(full, fmtLabels(labels), value))
+
+        for (name,labels),hist in sorted(self.histograms.items()):
+            full = PREFIX + name + '_seconds'
+            addType(full, 'histogram')
+            hist.fold()
+
+            cumulative = 0
+            for le,c in zip(BUCKETS + ('+Inf',), hist.counts):
+                cumulative += c
+                lines.append('{}_bucket{} {}'.format(full, fmtLabels(labels, (('le', str(le)),)), cumulative))
+            lines.append('{}_sum{} {}'.format(full, fmtLabels(labels), hist.sum))
+            lines.append('{}_count{} {}'.format(full, fmtLabels(labels), hist.count))
+
+        for name,labels,value in sorted(self._gauges()):
+            full = PREFIX + name
+            addType(full, 'gauge')
+            lines.append('{}{} {}'.format(full, fmtLabels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+    '''
+    A short human readable summary of every histogram, combining all of their labels except
+    for the ones given
+    '''
+    def summary(self, keep:Iterable[str]=()) -> List[Tuple[str, int, float, float, float]]:
+        keep = set(keep)
+        merged: Dict[str, _histogram] = {}
+        for (name,labels),hist in self.histograms.items():
+            hist.fold()
+            key = name + ''.join(' {}={}'.format(k, v) for k,v in labels if k in keep)
+            m = merged.get(key)
+            if m is None:
+                m = _histogram()
+                merged[key] = m
+            m.counts = [a + b for a,b in zip(m.counts, hist.counts)]
+            m.sum   += hist.sum
+            m.count += hist.count
+
+        return [(k, h.count, h.sum / h.count, h.quantile(0.5), h.quantile(0.99))
+                for k,h in sorted(merged.items()) if h.count > 0]
+
+    '''
+    Serves the metrics over HTTP at /metrics until cancelled
+    '''
+    async def serve(self, host:str='127.0.0.1', port:int=9100):
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info('Metrics available at http://%s:%s/metrics', host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Throw away the headers, nothing in them matters
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request.decode('latin-1').split()
+            if (len(parts) >= 2) and (parts[0] == 'GET') and (parts[1].split('?')[0] == '/metrics'):
+                status = '200 OK'
+                body = self.render().encode()
+            else:
+                status = '404 Not Found'
+                body = b'Not Found\n'
+
+            writer.write('HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+                status, len(body)).encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+'''
+The registry everything records into
+'''
+registry = Registry()
+
+def inc(name:str, value:float=1, **labels):
+    registry.inc(name, value, **labels)
+
+def observe(name:str, seconds:float, **labels):
+    registry.observe(name, seconds, **labels)
+
+def span(name:str, **labels) -> _span:
+    return registry.span(name, **labels)
+
+'''
+Times a call to Discord. Every call is recorded under the same name so they can be compared by route
+'''
+def api(route:str, guild=None) -> _span:
+    return registry.span('discord_api', route=route, guild=guild)
@@ -0,0 +1,51 @@
+import asyncio
+from collections import deque
+from typing import Dict,Hashable
+
+'''
+Limits how many operations can run at once and how many can be started in a window of time.
+
+Discord rate limits most message operations per channel. The library will wait out a 429 for
+us, but only after it happens, and concurrent requests will just queue up inside of it. This
+lets us spread out our own requests to stay inside the bucket in the first place.
+
+Usage:
+    async with limiter:
+        await message.edit(...)
+'''
+class Limiter():
+    def __init__(self, concurrency:int=4, rate:int=5, per:float=5.0):
+        self.rate   = rate
+        self.per    = per
+        self.sem    = asyncio.Semaphore(concurrency)
+        self.starts = deque(maxlen=rate)
+
+    async def __aenter__(self):
+        await self.sem.acquire()
+
+        # Wait for the oldest start in the window to fall out of it
+        loop = asyncio.get_running_loop()
+        while len(self.starts) == self.rate:
+            delay = self.starts[0] + self.per - loop.time()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        self.starts.append(loop.time())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.sem.release()
+
+'''
+Shared limiters by bucket. These are defaulted to Discord's message bucket, which is per channel
+'''
+_limiters: Dict[Hashable, Limiter] = {}
+
+def limiterFor(key:Hashable, concurrency:int=4, rate:int=5, per:float=5.0) -> Limiter:
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = Limiter(concurrency, rate, per)
+        _limiters[key] = limiter
+
+    return limiter
@@ -0,0 +1,289 @@
+import asyncio
+import heapq
+import itertools
+import log
+from typing import Any,Awaitable,Callable,Dict,Hashable,List
+
+logger = log.getLogger('render')
+
+'''
+Book keeping for a single key in the RenderScheduler
+
+Fields are as follows:
+cb        - The latest render requested. This is what gets run when the render fires
+group     - What the key's renders are grouped under for the per group limit, like the Cog
+first     - Loop time of the first request that hasn't been rendered yet, or None if nothing is pending
+deadline  - Loop time that the pending render should fire at
+notBefore - Loop time the next render can't fire before, which is how failed renders back off
+urgent    - Whether the pending render should go ahead of the ones that aren't
+attempts  - How many times in a row the render has failed
+cancelled - Set once the key's renders have been cancelled, until something new is requested
+task      - The task that waits on the deadline and hands the render to the workers
+wake      - Set to get the task to re-check the deadline early
+'''
+class _renderState():
+    def __init__(self):
+        self.cb        = None
+        self.group     = None
+        self.first     = None
+        self.deadline  = None
+        self.notBefore = 0.0
+        self.urgent    = False
+        self.attempts  = 0
+        self.cancelled = asyncio.Event()
+        self.task      = None
+        self.wake      = asyncio.Event()
+
+'''
+Collapses bursts of render requests for the same key into a single render, and runs the renders
+on a fixed pool of workers.
+
+A render fires once no new requests have come in for the debounce window, or once the oldest
+request has been waiting for maxLatency, whichever comes first. Only the most recent callback
+is run so that the render always reflects the latest state. There is never more than one render
+running at a time for the same key, requests that come in while one is running are rendered
+once it finishes.
+
+Renders that are ready are queued for the workers. Urgent renders go first, then whichever have
+been waiting the longest. Each group can only have groupLimit renders running at once, so a
+group whose renders are slow or stuck can't hold up everyone else's. A render that raises is
+retried with exponential backoff, with the latest callback if there have been new requests,
+up to retries times before it is dropped.
+
+The following are kept for monitoring:
+rendered  - Total number of renders that finished
+failed    - Total number of renders that raised an exception
+dropped   - Total number of renders given up on after running out of retries
+'''
+class RenderScheduler():
+    def __init__(self, debounce:float=1.0, maxLatency:float=5.0, workers:int=4, groupLimit:int=None,
+                 retries:int=3, retryDelay:float=1.0, retryMaxDelay:float=30.0):
+        self.debounce      = debounce
+        self.maxLatency    = maxLatency
+        self.workers       = max(1, workers)
+        self.groupLimit    = max(1, self.workers - 1) if groupLimit is None else groupLimit
+        self.retries       = retries
+        self.retryDelay    = retryDelay
+        self.retryMaxDelay = retryMaxDelay
+        self.states: Dict[Any, _renderState] = {}
+
+        # Heap of (priority, waiting since, order, key, state, callback, future)
+        self.ready: List[tuple] = []
+        self.readyWake = asyncio.Event()
+        self.order = itertools.count()
+        self.running: Dict[Hashable, int] = {}
+        self.pool: List[asyncio.Task] = []
+
+        self.rendered = 0
+        self.failed   = 0
+        self.dropped  = 0
+
+    '''
+    Requests a render for the key. The callback should be a function that takes no arguments
+    and returns an awaitable
+    '''
+    def schedule(self, key, cb:Callable[[], Awaitable[None]], group:Hashable=None):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        st = self.states.get(key)
+        if st is None:
+            st = _renderState()
+            self.states[key] = st
+
+        st.cb    = cb
+        st.group = group
+        st.cancelled.clear()
+        if st.first is None:
+            st.first = now
+        st.deadline = min(now + self.debounce, st.first + self.maxLatency)
+
+        if len(self.pool) == 0:
+            self.pool = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+        if st.task is None:
+            st.task = loop.create_task(self._run(key, st))
+
+    '''
+    Makes any pending render for the key fire right away without waiting for it, ahead of
+    renders that aren't urgent. This also skips any backoff from a failed render
+    '''
+    def expedite(self, key):
+        st = self.states.get(key)
+        if (st is None) or (st.first is None):
+            return
+
+        st.deadline  = st.first
+        st.notBefore = 0.0
+        st.urgent    = True
+        st.wake.set()
+
+    '''
+    Fires any pending render for the key right away, and waits until it (and anything
+    that was already rendering) is done. This returns early if the key is cancelled
+    '''
+    async def flush(self, key):
+        st = self.states.get(key)
+        if (st is None) or (st.task is None) or st.cancelled.is_set():
+            return
+
+        self.expedite(key)
+
+        # Waiting on the task doesn't cancel it if we stop waiting
+        cancelled = asyncio.get_running_loop().create_task(st.cancelled.wait())
+        try:
+            await asyncio.wait([st.task, cancelled], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancelled.cancel()
+
+    '''
+    Flushes every key that has a pending render
+    '''
+    async def flushAll(self):
+        await asyncio.gather(*[self.flush(k) for k in list(self.states)])
+
+    '''
+    Drops any pending render for the key. A render that is already running is left to finish,
+    but it isn't retried if it fails, and anyone flushing the key stops waiting for it
+    '''
+    def cancel(self, key):
+        st = self.states.get(key)
+        if st is None:
+            return
+
+        st.cb    = None
+        st.first = None
+        st.cancelled.set()
+        st.wake.set()
+
+    '''
+    Stops the workers. Anything still pending is dropped, so this should be called after flushAll
+    '''
+    def close(self):
+        for t in self.pool:
+            t.cancel()
+        self.pool = []
+
+        for item in self.ready:
+            item[6].cancel()
+        self.ready = []
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'pending':  len(self.states),
+            'ready':    len(self.ready),
+            'running':  sum(self.running.values()),
+            'rendered': self.rendered,
+            'failed':   self.failed,
+            'dropped':  self.dropped,
+        }
+
+    async def _run(self, key, st:_renderState):
+        loop = asyncio.get_running_loop()
+
+        try:
+            while st.first is not None:
+                # Wait until the deadline. It can move (or be cancelled) while we are waiting
+                delay = max(st.deadline, st.notBefore) - loop.time()
+                if delay > 0:
+                    st.wake.clear()
+                    try:
+                        await asyncio.wait_for(st.wake.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                cb = st.cb
+                waitingSince = st.first
+                st.cb    = None
+                st.first = None
+
+                # Hand it to the workers and wait for it to be done
+                done = loop.create_future()
+                heapq.heappush(self.ready, (0 if st.urgent else 1, waitingSince, next(self.order), key, st, cb, done))
+                st.urgent = False
+                self.readyWake.set()
+
+                if await done:
+                    st.attempts = 0
+                    continue
+
+                # Nothing wants this rendered anymore
+                if st.cancelled.is_set():
+                    st.attempts = 0
+                    continue
+
+                st.attempts += 1
+                if st.attempts > self.retries:
+                    logger.error('Render for %s failed %d times, giving up', key, st.attempts,
+                                 extra=log.fields(group=st.group))
+                    self.dropped += 1
+                    st.attempts = 0
+                    continue
+
+                # Try again after backing off, with whatever was requested since if anything was
+                if st.first is None:
+                    st.cb    = cb
+                    st.first = waitingSince
+                    st.deadline = loop.time()
+                st.notBefore = loop.time() + min(self.retryDelay * 2 ** (st.attempts - 1), self.retryMaxDelay)
+        finally:
+            st.task = None
+            if (self.states.get(key) is st) and (st.first is None):
+                self.states.pop(key)
+
+    '''
+    Takes the first ready render whose group has room to run another one, or None if there
+    aren't any
+    '''
+    def _next(self):
+        skipped = []
+        job = None
+        while len(self.ready) > 0:
+            item = heapq.heappop(self.ready)
+            if self.running.get(item[4].group, 0) < self.groupLimit:
+                job = item
+                break
+            skipped.append(item)
+
+        for item in skipped:
+            heapq.heappush(self.ready, item)
+        return job
+
+    async def _worker(self):
+        while True:
+            job = self._next()
+            if job is None:
+                self.readyWake.clear()
+                await self.readyWake.wait()
+                continue
+
+            _,_,_,key,st,cb,done = job
+            group = st.group
+
+            # It was cancelled while waiting for a worker
+            if st.cancelled.is_set():
+                done.set_result(True)
+                continue
+            self.running[group] = self.running.get(group, 0) + 1
+
+            ok = False
+            try:
+                await cb()
+                ok = True
+                self.rendered += 1
+            except asyncio.CancelledError:
+                done.cancel()
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception('Render for %s failed', key, extra=log.fields(group=group))
+            finally:
+                self.running[group] -= 1
+                if self.running[group] == 0:
+                    self.running.pop(group)
+
+                # Something that was held back by the group limit might be able to go now
+                self.readyWake.set()
+                if not done.done():
+                    done.set_result(ok)
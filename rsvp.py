@@ -1,16 +1,141 @@
 # External Libraries
+import asyncio
 from datetime import datetime, timedelta
 import disnake
 from disnake.ext import commands
-import emoji
-import re
+import log
+import metrics
+import ratelimit
 import textwrap
 from typing import Any,Dict,List,Tuple
 
 # Internal Libraries
+import emojiparser
 #import extmessage
 import tracker
 
+logger = log.getLogger('rsvp')
+
+'''
+The Cog data kept on each RSVP tracker. It holds the special reacts parsed out of the message, and
+an incrementally maintained view of the entries so that the sign-up list doesn't need to be
+recomputed from the full entry history on every reaction.
+
+Fields are as follows:
+emojis    - The special reacts in the order they appear in the message
+rsvpKey   - The emojiKey of the sign-up emoji
+specials  - The special reacts, looked up by emojiKey
+signups   - The IDs of the signed up users in sign-up order. The owner is always first
+sreacts   - For each user ID, the special reacts they have made in the order they made them
+fields    - The embed field values from the last render
+fingerprint - A hash of everything shown in the embed from the last render
+seeded    - The emojiKeys of the reacts we have added to the message
+title     - The title set by the last edit, or None to keep the one on the message
+'''
+class rsvpRoster():
+    # Discord's maximum length of an embed field value
+    MAX_FIELD_LEN = 1024
+
+    def __init__(self, ownerId:int, rsvpEmoji, emojis:List[disnake.PartialEmoji]):
+        self.emojis   = emojis
+        self.rsvpKey  = tracker.emojiKey(rsvpEmoji)
+        self.specials = {tracker.emojiKey(r):r for r in emojis}
+        self.signups  = {ownerId: None}
+        self.ownerId  = ownerId
+        self.sreacts  = {}
+        self.fields   = []
+        self.fingerprint = None
+        self.seeded   = set()
+        self.title    = None
+
+    '''
+    Replays the full entry history. This is only needed when the roster is first created
+    '''
+    def rebuild(self, entries:List[tracker.trackerEntry]):
+        for e in entries:
+            if e.valid:
+                self.update(e)
+
+    '''
+    Applies a single added or invalidated entry. Returns True if this changed the roster
+    '''
+    def update(self, entry:tracker.trackerEntry) -> bool:
+        key = entry.react
+        uid = entry.userId
+
+        # Check if this is the signup react
+        if key == self.rsvpKey:
+            # The owner is always on the list regardless of whether they have the react or not
+            if uid == self.ownerId:
+                return False
+
+            if entry.valid:
+                if uid in self.signups:
+                    return False
+                self.signups[uid] = None
+            else:
+                # The values are all None, so check membership rather than what pop returns
+                if uid not in self.signups:
+                    return False
+                del self.signups[uid]
+            return True
+
+        # Check if this is a special react
+        r = self.specials.get(key)
+        if r is None:
+            return False
+
+        if entry.valid:
+            reacts = self.sreacts.setdefault(uid, {})
+            if key in reacts:
+                return False
+            reacts[key] = r
+        else:
+            reacts = self.sreacts.get(uid)
+            if (reacts is None) or (reacts.pop(key, None) is None):
+                return False
+            if len(reacts) == 0:
+                self.sreacts.pop(uid)
+        return True
+
+    '''
+    Generates the sign-up list, broken up by the maximum field length. Users are looked up by ID
+    for their names, and anyone missing is shown as a mention instead
+    '''
+    def renderFields(self, header:str, users:Dict[int, disnake.abc.User]) -> List[str]:
+        # Go through the signup list in order, adding special reacts if applicable
+        # Signup list enumeration always starts at 1 for non-programmers
+        lines = [header]
+        for cnt,uid in enumerate(self.signups, start=1):
+            user = users.get(uid)
+            name = '<@{}>'.format(uid) if user is None else user.display_name
+
+            reacts = self.sreacts.get(uid)
+            if reacts is None:
+                lines.append('{} - {}\n'.format(cnt, name))
+            else:
+                lines.append('{} - {} [ {}]\n'.format(cnt, name,
+                                                      ''.join('{} '.format(r) for r in reacts.values())))
+
+        # Now go through the message we want and break it up by the max field length
+        # NOTE: This does not respect maximum embed length and can still fail there
+        fields = []
+        cMsg = []
+        cLen = 0
+        for l in ''.join(lines).splitlines(keepends=True):
+            if (cLen + len(l) > self.MAX_FIELD_LEN) and (cLen > 0):
+                fields.append(''.join(cMsg))
+                cMsg = []
+                cLen = 0
+
+            cMsg.append(l)
+            cLen += len(l)
+
+        if cLen > 0:
+            fields.append(''.join(cMsg))
+
+        return fields
+
 class rsvp(commands.Cog):
     """ Create event RSVPs.
 
@@ -43,17 +168,25 @@ class rsvp(commands.Cog):
     expireTimeExt  = timedelta(days=1, hours=0)
     expireTimeFmt  = '%A %b %d - %H:%M:%S %Z'
 
-    # RegEx to search a message for a line starting with a discord emoji
-    emojiRegex = re.compile(r'^(<:(\w*):(\d*)>)')
-
     def __init__(self, bot, settings):
         self.bot = bot
 
+        # Finds the special reacts in messages. The emoji package it needs is loaded in the background
+        emojiparser.preload()
+        self.emojiParser = emojiparser.EmojiParser(cacheSize=settings.get('emojiCacheSize', 256))
+
         self.rsvps = {}
 
+        # Reactions are added to new messages in the background. This is how many can be in flight at once
+        self.reactionConcurrency = settings.get('reactionConcurrency', 2)
+        self.seedTasks = set()
+
+        # How many message edits were skipped because nothing visible changed
+        self.editsSkipped = 0
+
         # Register out callbacks with the reactionTracker
         self.tracker = self.bot.get_cog('reactTracker')
-        self.tracker.registerCallbacks(type(self).__name__, self.msgGenerator, self.parseMsg)
+        self.tracker.registerCallbacks(type(self).__name__, self.msgGenerator, self.parseMsg, self.entryUpdate)
 
         # Create sign-up emoji from settings
         # If we have a user setting for it, use it. Otherwise we use a ":raisedhands:" emoji as a default
@@ -65,121 +198,133 @@ class rsvp(commands.Cog):
             self.rsvpEmoji= disnake.PartialEmoji(animated=False,
                                                 name='\U0001F64C')
 
+        # The start of the sign-up list never changes, so only make it once
+        # This is broken up this way to prevent stupid tabs from making indents look weird
+        self.msgHeader = textwrap.dedent(self.templateMessageBody.format(self.rsvpEmoji))
+
     '''
     Helper function that generates the RSVP message
     '''
     async def msgGenerator(self, event:tracker.Tracker):
-        # Create the main message
-        # This is broken up this way to prevent stupid tabs from making indents look weird
-        msg = textwrap.dedent(self.templateMessageBody.format(self.rsvpEmoji))
-
-        # First collect the list of valid signups as well as valid reacts to the special reacts
-        # To prevent strange shenanigans, the owner is always first regardless if they have
-        # the appropriate react or not
-        signups = [event.owner]
-        sreacts = {}
-        for e in event.entries:
-            # Ignore invalid entries
-            if not e.valid:
-                continue
-
-            # Check if this is the signup react
-            if e.react == self.rsvpEmoji:
-                # Prevent double counting if the owner reacted againg
-                if e.user in signups:
-                    continue
-
-                signups.append(e.user)
-                continue
-
-            # Check if this is a special react
-            for r in event.cogData:
-                if e.react == r:
-                    if e.user in sreacts:
-                        sreacts[e.user].append(r)
-                    else:
-                        sreacts[e.user] = [r]
-
-        # Go through the signup list in order, adding special reacts if applicable
-        # Signup list enumeration always starts at 1 for non-programmers
-        cnt = 1
-        for s in signups:
-            msg += '{} - {}'.format(cnt, s.display_name)
-            if s in sreacts:
-                msg += ' [ '
-                for r in sreacts[s]:
-                    msg += '{} '.format(r)
-                msg += ']'
-            msg += '\n'
-            cnt += 1
+        roster = event.cogData
 
         # Retrieve embed object from the message object
+        # The embeds are replaced whenever Discord tells us the message changed, so anything edited is
+        # put back from what we keep rather than trusting it is still there
         msgEmbed = event.msgObj.embeds[0]
+        if roster.title is not None:
+            msgEmbed.title = roster.title
+        msgEmbed.description = event.message
+
+        # Metadata is located in the footer, and the expiration time can change
+        footer = self.templateMessageFoot.format(event.msgObj.id, event.expire.strftime(self.expireTimeFmt))
+
+        users  = await self.tracker.resolveUsers(event.owner.guild, roster.signups)
+        fields = roster.renderFields(self.msgHeader, users)
+
+        # Plenty of reactions don't change what is shown, like ones that aren't tracked or the owner
+        # signing up. Don't bother Discord if the message would come out the same as last time
+        fingerprint = hash((msgEmbed.title, msgEmbed.description, footer, tuple(fields)))
+        if fingerprint == roster.fingerprint:
+            self.editsSkipped += 1
+            metrics.inc('edits_skipped', guild=event.owner.guild.id, cog=type(self).__name__)
+            return
 
-        # We will delete all fields that are signups and recreate them now
-        msgEmbed.clear_fields()
+        msgEmbed.set_footer(text=footer)
 
-        # Now go through the message we want and break it up by the max field length
-        # NOTE: This does not respect maximum embed length and can still fail there
-        cMsg = ''
-        fieldCnt = 0
-        for l in msg.splitlines(keepends=True):
-            if len(cMsg + l) > 1024:
-                if (fieldCnt == 0):
-                    msgEmbed.add_field(name='Sign-ups', value=cMsg, inline=False)
-                else:
-                    msgEmbed.add_field(name='\u200B', value=cMsg, inline=False)
-
-                cMsg = ''
-                fieldCnt += 1
-
-            cMsg += l
-
-        if len(cMsg) > 0:
-            if (fieldCnt == 0):
-                msgEmbed.add_field(name='Sign-ups', value=cMsg, inline=False)
-            else:
-                msgEmbed.add_field(name='\u200B', value=cMsg, inline=False)
+        # Only touch the fields that changed since the last time we rendered
+        # Fields that are signups are named after the first one, the rest are blank
+        if len(msgEmbed.fields) != len(roster.fields):
+            msgEmbed.clear_fields()
+            roster.fields = []
+
+        for i,f in enumerate(fields):
+            if i >= len(roster.fields):
+                msgEmbed.add_field(name='Sign-ups' if i == 0 else '\u200B', value=f, inline=False)
+            elif roster.fields[i] != f:
+                msgEmbed.set_field_at(i, name='Sign-ups' if i == 0 else '\u200B', value=f, inline=False)
+
+        for i in reversed(range(len(fields), len(roster.fields))):
+            msgEmbed.remove_field(i)
 
-        await event.msgObj.edit(embed=msgEmbed)
+        roster.fields = fields
+
+        with metrics.api('edit', event.owner.guild.id):
+            await event.msgObj.edit(embed=msgEmbed)
+        roster.fingerprint = fingerprint
+
+    '''
+    Keeps the roster up to date as the tracker adds and invalidates entries. Returns False if the
+    sign-up list didn't change, so the message doesn't need updating
+    '''
+    def entryUpdate(self, event:tracker.Tracker, entry:tracker.trackerEntry) -> bool:
+        if event.cogData is None:
+            return True
+
+        return event.cogData.update(entry)
 
     '''
     Parses a message for emojis that are at the start of the line, indicating that they
-    are special
+    are special. Since this changes what reacts are tracked, the roster is rebuilt
     '''
     def parseMsg(self, event:tracker.Tracker):
-        trackedEmojis = []
-
-        for s in iter(event.message.splitlines()):
-            # Remove all whitespace at the start of the line
-            sStrip = s.lstrip()
-
-            # Search if its a Discord style emoji first
-            matchObj = self.emojiRegex.search(sStrip)
-            if matchObj is not None:
-                tEmoji = disnake.PartialEmoji(animated=False, name=matchObj.group(2), id=int(matchObj.group(3)))
-
-                # Prevent duplicates from making it into the list
-                if tEmoji not in trackedEmojis:
-                    trackedEmojis.append(tEmoji)
-                continue
-
-            # Next try to lookup the emoji by unicode
-            # Check to make sure the first character ISNT a normal character since the emoji library's regex
-            # will find anything. This check allows us to make sure a unicode emoji is at the start of the line
-            # We also need to check for ':' since a unicode emoji may be the name
-            if ((len(sStrip) > 0) and (sStrip[0] == ':' or not (sStrip[0].isascii()))):
-                matchObj = emoji.emoji_list(sStrip)
-                if matchObj is not None:
-                    # This only will grab the first emoji in a line. This is by design
-                    tEmoji = disnake.PartialEmoji(animated=False, name=matchObj[0]['emoji'], id=None)
-
-                    # Prevent duplicates from making it into the list
-                    if tEmoji not in trackedEmojis:
-                        trackedEmojis.append(tEmoji)
-                    continue
-
-        event.cogData = trackedEmojis
+        trackedEmojis = self.emojiParser.parse(event.message)
+
+        roster = rsvpRoster(event.owner.id, self.rsvpEmoji, trackedEmojis)
+        roster.rebuild(event.entries)
+
+        # Keep the fields we last rendered so the next render only touches what changed
+        if event.cogData is not None:
+            roster.fields = event.cogData.fields
+            roster.fingerprint = event.cogData.fingerprint
+            roster.seeded = event.cogData.seeded
+            roster.title = event.cogData.title
+
+        event.cogData = roster
+
+    '''
+    Adds any of the sign-up and special reacts that we haven't added to the message yet, so people don't
+    have to dig them up. This happens in the background, and the reactions are added in the order given
+    '''
+    def seedReactions(self, event:tracker.Tracker):
+        roster = event.cogData
+
+        # What we've seeded isn't saved, so go by the reactions we already have on the message. This
+        # keeps an edit after a restart from adding them all over again
+        if event.msgObj is not None:
+            for r in event.msgObj.reactions:
+                if r.me:
+                    roster.seeded.add(tracker.emojiKey(r.emoji))
+
+        emojis = []
+        for e in [self.rsvpEmoji] + roster.emojis:
+            key = tracker.emojiKey(e)
+            if key not in roster.seeded:
+                roster.seeded.add(key)
+                emojis.append(e)
+
+        if len(emojis) == 0:
+            return
+
+        task = self.bot.loop.create_task(self._seedReactions(event.msgObj, emojis))
+        self.seedTasks.add(task)
+        task.add_done_callback(self.seedTasks.discard)
+
+    async def _seedReactions(self, msgObj:disnake.Message, emojis:List[disnake.PartialEmoji]):
+        # Discord only allows adding a reaction every quarter second in a channel. Keeping a couple in
+        # flight at once keeps us at that rate rather than waiting on every round trip
+        limiter = ratelimit.limiterFor(('reactions', msgObj.channel.id),
+                                       concurrency=self.reactionConcurrency, rate=1, per=0.25)
+
+        async def addReaction(e):
+            async with limiter:
+                try:
+                    with metrics.api('add_reaction', msgObj.guild.id):
+                        await msgObj.add_reaction(e)
+                except disnake.HTTPException as ex:
+                    logger.warning('Could not add reaction %s to %s: %s', e, msgObj.id, ex)
+
+        await asyncio.gather(*[addReaction(e) for e in emojis])
 
     @commands.group(pass_context=True)
     async def rsvp(self, ctx):
@@ -201,42 +346,36 @@ class rsvp(commands.Cog):
         #msg.add_field(name='Details', value=msgBody, inline=False)
         msg.add_field(name='Sign-ups', value='Preparing sign ups...', inline=False)
 
-        msgObj = await ctx.channel.send(embed=msg)
+        with metrics.api('send', ctx.guild.id):
+            msgObj = await ctx.channel.send(embed=msg)
 
         # Finish setting up the RSVP Event Object
         event = self.tracker.createTrackedItem(msgObj=msgObj, user=owner, msg=msgBody, cogOwner=type(self).__name__)
 
-        # Add footer now that we have the message ID
-        msg = msgObj.embeds[0]
-        msg.set_footer(text=self.templateMessageFoot.format(event.msgObj.id, event.expire.strftime(self.expireTimeFmt)))
-        await msgObj.edit(embed=msg)
-
         # Search for special emojis
         self.parseMsg(event)
 
-        # Update the RSVP Message from the bot
-        await self.msgGenerator(event)
+        # Update the RSVP Message from the bot. This also adds the footer now that we have the message ID
+        self.tracker.requestRender(msgObj.id, event, urgent=True)
 
-        # For convenience, add the reaction to the post so people don't have to dig it up
-        await event.msgObj.add_reaction(self.rsvpEmoji)
+        # For convenience, add the reactions to the post so people don't have to dig it up
+        self.seedReactions(event)
 
-        for e in event.cogData:
-            await event.msgObj.add_reaction(e)
-
-        print('Created an RSVP with ID {}'.format(event.msgObj.id))
+        logger.info('Created an RSVP', extra=log.fields(msgId=event.msgObj.id, owner=owner.id))
 
         # Delete the original message now that we're done parsing it
-        await ctx.message.delete()
+        with metrics.api('delete', ctx.guild.id):
+            await ctx.message.delete()
 
     @add.error
     async def add_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
-            print('RSVP Add Failed to convert a passed argument')
+            logger.info('Add failed to convert a passed argument')
             await ctx.send('RSVP Add could not parse out a title and/or new description. ' +
                            'Please check your syntax.\n' +
                            'It should be: add "<title>" <new description>')
         else:
-            print(error)
+            logger.error('Command failed: %s', error)
 
     @rsvp.command(brief = '''Edits an existing RSVP event message.''',
                   help  = '''Edits an existing RSVP event message. Only the owner of the message can edit
@@ -248,59 +387,51 @@ class rsvp(commands.Cog):
             return
 
         # Grab the event and make sure we can operate on it
-        event = self.tracker.getTrackedItem(msgId)
+        event = await self.tracker.fetchTrackedItem(msgId)
         if event is None:
-            print('RSVP Edit is not tracking anything with ID {}. Skipping...'.format(msgId))
+            logger.info('Edit is not tracking anything with ID %s. Skipping...', msgId)
             await ctx.send('RSVP Edit could not find a message that is active with ID {}. Double check your message ID.'.format(msgId))
             return
 
         ## Only the owner is allowed to edit
         if ctx.author != event.owner:
-            print('RSVP Edit was called by {}, who is not the owner ({})'.format(
-                ctx.author.display_name,
-                event.owner.display_name))
+            logger.info('Edit was called by %s, who is not the owner (%s)',
+                        ctx.author.display_name,
+                        event.owner.display_name)
             await ctx.send('RSVP Edit can only be used on messages you own. You are {} but the owner is {}'.format(
                 ctx.author.display_name,
                 event.owner.display_name))
             return
 
-        # Update the title and details field
-        msgObj = event.msgObj
-        msgEmbed = msgObj.embeds[0]
-        msgEmbed.title = title
-        msgEmbed.description = msgBody
-        await event.msgObj.edit(embed=msgEmbed)
-
         # Update Emojis
-        event.message = msgBody
+        self.tracker.updateTrackedMessage(msgId, msgBody)
         self.parseMsg(event)
 
+        # Update the title and details field. These are kept with the event and sent with the sign-ups below
+        event.cogData.title = title
+
         # TODO: There is an edge case here where the edit will remove existing reacts. We currently don't remove
         #       the ones we made ourselves, but we should probably consider it. It gets complicated as we will
         #       need to determine not only that the emoji isn't in the tracked set now, but also that we were
         #       the ones who created it, and then remove it
-        for trackedEmoji in event.cogData:
-            for react in event.msgObj.reactions:
-                if trackedEmoji == react.emoji:
-                    break
-            else:
-                await event.msgObj.add_reaction(trackedEmoji)
+        self.seedReactions(event)
 
         # Update message
-        await self.msgGenerator(event)
+        self.tracker.requestRender(msgId, event, urgent=True)
 
         # Delete the modifying message
-        await ctx.message.delete()
+        with metrics.api('delete', ctx.guild.id):
+            await ctx.message.delete()
 
     @edit.error
     async def edit_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
-            print('RSVP Edit Failed to convert a passed argument')
+            logger.info('Edit failed to convert a passed argument')
             await ctx.send('RSVP Edit could not parse out a message ID to delete, title, and/or new description. ' +
                            'Please check your syntax.\n' +
                            'It should be: edit <message ID> "<title>" <new description>')
         else:
-            print(error)
+            logger.error('Command failed: %s', error)
 
     @rsvp.command(brief = '''Deletes an existing RSVP event message.''',
                   help  = '''Deletes an existing RSVP message. Only the owner of the message can delete it.
@@ -313,39 +444,45 @@ class rsvp(commands.Cog):
             return
 
         # Look up event
-        event = self.tracker.getTrackedItem(msgId)
+        event = await self.tracker.fetchTrackedItem(msgId)
 
         # Skip modifying anything if we aren't tracking this message
         if event is None:
-            print('RSVP Delete is not tracking anything with ID {}. Skipping...'.format(msgId))
+            logger.info('Delete is not tracking anything with ID %s. Skipping...', msgId)
             await ctx.send('RSVP Delete could not find a message that is active with ID {}. Double check your message ID.'.format(msgId))
             return
 
         # Only the owner is allowed to delete
         if ctx.author != event.owner:
-            print('RSVP Delete was called by {}, who is not the owner ({})'.format(
-                ctx.author.display_name,
-                event.owner.display_name))
+            logger.info('Delete was called by %s, who is not the owner (%s)',
+                        ctx.author.display_name,
+                        event.owner.display_name)
             await ctx.send('RSVP Delete can only be used on messages you own. You are {} but the owner is {}'.format(
                 ctx.author.display_name,
                 event.owner.display_name))
             return
 
-        # Delete the message
-        await event.msgObj.delete()
+        # Let a render that's already going finish, and stop tracking it before the message goes
+        # away so nothing else tries to edit it or handle its reactions
+        await self.tracker.flushRender(msgId)
         self.tracker.deleteTrackedItem(msgId)
 
+        # Delete the message
+        with metrics.api('delete', ctx.guild.id):
+            await event.msgObj.delete()
+
         # Delete the modifying message to indicate that we've processed it
-        await ctx.message.delete()
+        with metrics.api('delete', ctx.guild.id):
+            await ctx.message.delete()
 
     @delete.error
     async def delete_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
-            print('RSVP Delete Failed to convert a passed argument')
+            logger.info('Delete failed to convert a passed argument')
             await ctx.send('RSVP Delete could not parse out a message ID to delete. Please check your syntax.\n' +
                             'It should be: delete <message ID>')
         else:
-            print(error)
+            logger.error('Command failed: %s', error)
 
     @rsvp.command(brief = '''Extends the duration of an existing RSVP event message.''',
                   help  = '''Extends the duration of an existing RSVP message. Only the owner of the message can
@@ -362,31 +499,28 @@ class rsvp(commands.Cog):
 
         # Skip modifying anything if we aren't tracking this message
         if event is None:
-            print('RSVP Extend is not tracking anything with ID {}. Skipping...'.format(msgId))
+            logger.info('Extend is not tracking anything with ID %s. Skipping...', msgId)
             await ctx.send('RSVP Extend could not find a message that is active with ID {}. Double check your message ID.'.format(msgId))
             return
 
         # Extend the message
         extTime = self.expireTimeExt * qty
-        event.expire += extTime
-
-        # We need to edit the footer with the new expiration time
-        msgObj = event.msgObj
-        msg = msgObj.embeds[0]
-        msg.set_footer(text=self.templateMessageFoot.format(event.msgObj.id, event.expire.strftime(self.expireTimeFmt)))
-        await msgObj.edit(embed=msg)
+        self.tracker.extendTrackedItem(msgId, extTime)
 
-        # Reprint the message
-        #await self.msgGenerator(event)
+        # Reprint the message, which updates the footer with the new expiration time. This also gets
+        # any pending sign-up update out along with it
+        self.tracker.requestRender(msgId, event, urgent=True)
+        await self.tracker.flushRender(msgId)
 
         # Delete the modifying message to indicate that we've processed it
-        await ctx.message.delete()
+        with metrics.api('delete', ctx.guild.id):
+            await ctx.message.delete()
 
     @extend.error
     async def extend_error(self, ctx, error):
         if isinstance(error, commands.BadArgument):
-            print('RSVP Extend Failed to convert a passed argument')
+            logger.info('Extend failed to convert a passed argument')
             await ctx.send('RSVP Extend could not parse out a message ID and/or time quantity to extend. Please check your syntax.\n' +
                             'It should be: extend <message ID> <quantity>')
         else:
-            print(error)
\ No newline at end of file
+            logger.error('Command failed: %s', error)
\ No newline at end of file
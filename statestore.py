@@ -0,0 +1,180 @@
+import asyncio
+import journal
+import json
+import sqlite3
+from typing import Any,Callable,Dict,List,Tuple
+
+'''
+Stores the tracked items in SQLite, so several bot processes can share the same state.
+
+This works the same way as the Journal and can be used in its place. Changes are appended as
+records and written in batches from a background thread, and the records are periodically folded
+into a row per tracked item. The records are the same as the Journal's, see journal.py.
+
+Everything is partitioned by guild. Each process only owns some of the gateway shards, and a
+guild's events only ever go to the shard that it is on, so each process only loads, writes and
+compacts the guilds on its own shards. The database is in WAL mode so processes can read while
+another one is writing.
+
+dbFile      - The SQLite database to use. It is created if it doesn't exist
+shardIds    - The shards this process owns, or None if it owns every guild
+shardCount  - The total number of shards
+'''
+class StateStore():
+    def __init__(self, dbFile:str, shardIds:List[int]=None, shardCount:int=1, syncInterval:float=1.0, compactRecords:int=10000):
+        self.dbFile         = dbFile
+        self.shardIds       = None if shardIds is None else list(shardIds)
+        self.shardCount     = shardCount
+        self.syncInterval   = syncInterval
+        self.compactRecords = compactRecords
+
+        self.seq        = 0
+        self.pending: List[Tuple[int, int, str]] = []
+        self.logRecords = 0
+        self.db         = None
+
+        # The guild each item is in, since only creation records say
+        self.itemGuild: Dict[int, int] = {}
+
+        # Only one thing can write to the database at once
+        self.lock = asyncio.Lock()
+
+    '''
+    Whether the store is open. This matches the Journal so the two can be swapped
+    '''
+    @property
+    def fd(self):
+        return self.db
+
+    '''
+    The SQL condition and its parameters for the guilds this process owns. Discord puts a guild on
+    shard (guild ID >> 22) % shard count
+    '''
+    def _owned(self) -> Tuple[str, List[int]]:
+        if self.shardIds is None:
+            return '1', []
+        return '(guild_id >> 22) % ? IN ({})'.format(','.join('?' * len(self.shardIds))), [self.shardCount] + self.shardIds
+
+    '''
+    Adds a record. The record is durable once the next sync finishes
+    '''
+    def append(self, rType:str, itemId:int, **fields):
+        self.seq += 1
+
+        if rType == 'c':
+            self.itemGuild[itemId] = fields['d']['ownerGuild']
+        guildId = self.itemGuild.get(itemId, 0)
+        if rType == 'd':
+            self.itemGuild.pop(itemId, None)
+
+        rec = {'s': self.seq, 't': rType, 'id': itemId}
+        rec.update(fields)
+
+        self.pending.append((itemId, guildId, json.dumps(rec, separators=(',', ':'))))
+
+    '''
+    Rebuilds the state of encoded trackers for the guilds we own from their rows and the records
+    since then. This also opens the database, so it must be called before anything is synced
+    '''
+    def replay(self) -> Dict[int, Dict[str, Any]]:
+        # The connection is only ever used by one thread at a time, under the lock
+        self.db = sqlite3.connect(self.dbFile, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.execute('PRAGMA busy_timeout=5000')
+        self.db.execute('CREATE TABLE IF NOT EXISTS items (item_id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, data TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS records (seq INTEGER PRIMARY KEY AUTOINCREMENT, item_id INTEGER NOT NULL, guild_id INTEGER NOT NULL, rec TEXT NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS items_guild ON items (guild_id)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS records_guild ON records (guild_id)')
+
+        where,params = self._owned()
+
+        state = {}
+        for itemId,guildId,data in self.db.execute('SELECT item_id, guild_id, data FROM items WHERE ' + where, params):
+            state[itemId] = json.loads(data)
+            self.itemGuild[itemId] = guildId
+
+        # Records are applied in the order they were written, which is also the order they happened
+        # in since each guild only ever has one process writing to it
+        records = 0
+        for itemId,guildId,rec in self.db.execute('SELECT item_id, guild_id, rec FROM records WHERE {} ORDER BY seq'.format(where), params):
+            rec = json.loads(rec)
+            journal.Journal.apply(state, rec)
+            records += 1
+            if rec['t'] == 'c':
+                self.itemGuild[itemId] = guildId
+
+        self.itemGuild  = {k:v for k,v in self.itemGuild.items() if k in state}
+        self.logRecords = records
+
+        return state
+
+    '''
+    Writes out everything that has been appended in one transaction. Returns True if there are
+    enough records that they should be compacted
+    '''
+    async def sync(self) -> bool:
+        async with self.lock:
+            # Everything was saved when it was closed
+            if self.db is None:
+                return False
+
+            if len(self.pending) > 0:
+                rows = self.pending
+                self.logRecords += len(rows)
+                self.pending = []
+
+                await asyncio.get_running_loop().run_in_executor(None, self._write, rows)
+
+        return self.logRecords >= self.compactRecords
+
+    def _write(self, rows:List[Tuple[int, int, str]]):
+        with self._transaction():
+            self.db.executemany('INSERT INTO records (item_id, guild_id, rec) VALUES (?, ?, ?)', rows)
+
+    '''
+    Replaces the rows for the guilds we own with the full state, and drops their records. getState
+    is called once nothing else is writing, and must return the encoded state including everything
+    appended so far
+    '''
+    async def snapshot(self, getState:Callable[[], Dict[int, Dict[str, Any]]]):
+        async with self.lock:
+            if self.db is None:
+                return
+
+            # Anything still pending is already part of the state
+            self.pending = []
+            state = getState()
+            rows = [(k, v['ownerGuild'], json.dumps(v, separators=(',', ':'))) for k,v in state.items()]
+
+            await asyncio.get_running_loop().run_in_executor(None, self._writeSnapshot, rows)
+            self.logRecords = 0
+
+    def _writeSnapshot(self, rows:List[Tuple[int, int, str]]):
+        where,params = self._owned()
+        with self._transaction():
+            self.db.execute('DELETE FROM items WHERE ' + where, params)
+            self.db.execute('DELETE FROM records WHERE ' + where, params)
+            self.db.executemany('INSERT OR REPLACE INTO items (item_id, guild_id, data) VALUES (?, ?, ?)', rows)
+
+    def _transaction(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return _commitOnExit(self.db)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+'''
+Commits the transaction that was started if the block finishes, and rolls it back if it raises
+'''
+class _commitOnExit():
+    def __init__(self, db:sqlite3.Connection):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
@@ -0,0 +1,132 @@
+'''
+Runs the bot sharded across several processes, and restarts any that stop.
+
+Each process runs main.py with its own block of the gateway shards, so the bot can use more than
+one core and gateway connection. Discord sends everything for a guild to the shard it is on, so
+each process handles its own guilds' commands and reactions without needing the others. They share
+the tracker state through a SQLite database, where each only reads and writes its own guilds.
+
+This is configured with the sharding section of lolotron_config.json:
+shardCount  - Total number of shards. Defaults to what Discord recommends for the bot
+processes   - Number of processes to split the shards between. Defaults to 2
+
+Run from the repository root instead of main.py:
+    py supervisor.py
+'''
+import asyncio
+import json
+import log
+import signal
+import sys
+from typing import List
+
+logger = log.getLogger('supervisor')
+
+# How long to wait before restarting a process, doubling every time it stops quickly, up to the max
+RESTART_DELAY     = 1.0
+RESTART_MAX_DELAY = 60.0
+
+# A process that has been running this long is considered to have started properly
+STABLE_TIME = 60.0
+
+'''
+Asks Discord how many shards it recommends for the bot
+'''
+async def recommendedShards(token:str) -> int:
+    # The supervisor doesn't need the library for anything else, so don't load it unless we have to
+    import disnake
+
+    http = disnake.http.HTTPClient(loop=asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shards,_,_ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shards
+
+'''
+Splits the shards into contiguous blocks, one per process
+'''
+def splitShards(shardCount:int, processes:int) -> List[List[int]]:
+    processes = max(1, min(processes, shardCount))
+    size,extra = divmod(shardCount, processes)
+
+    blocks = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        blocks.append(list(range(start, end)))
+        start = end
+    return blocks
+
+'''
+Runs one worker process, restarting it whenever it stops, until stopping is set
+'''
+async def runWorker(worker:int, shardIds:List[int], shardCount:int, stopping:asyncio.Event, procs:dict):
+    loop = asyncio.get_running_loop()
+    delay = RESTART_DELAY
+
+    while not stopping.is_set():
+        logger.info('Starting worker %d with shards %s', worker, shardIds)
+        started = loop.time()
+        proc = await asyncio.create_subprocess_exec(sys.executable, 'main.py',
+                                                    '--shard-ids',   ','.join(str(s) for s in shardIds),
+                                                    '--shard-count', str(shardCount),
+                                                    '--worker',      str(worker))
+        procs[worker] = proc
+        code = await proc.wait()
+        procs.pop(worker, None)
+
+        if stopping.is_set():
+            break
+
+        # Back off if it keeps stopping right away, so a bad config doesn't spin
+        if loop.time() - started >= STABLE_TIME:
+            delay = RESTART_DELAY
+        logger.warning('Worker %d stopped with code %s, restarting in %.0fs', worker, code, delay)
+        try:
+            await asyncio.wait_for(stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        delay = min(delay * 2, RESTART_MAX_DELAY)
+
+async def supervise(genSettings:dict):
+    sharding = genSettings.get('sharding', {})
+
+    shardCount = sharding.get('shardCount')
+    if shardCount is None:
+        shardCount = await recommendedShards(genSettings['general']['token'])
+    blocks = splitShards(shardCount, sharding.get('processes', 2))
+    logger.info('Running %d shards in %d processes', shardCount, len(blocks))
+
+    # Stop the workers cleanly so they get to save their state
+    stopping = asyncio.Event()
+    procs = {}
+    def stop():
+        stopping.set()
+        for proc in procs.values():
+            if proc.returncode is None:
+                proc.send_signal(signal.SIGINT)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:
+            # Windows doesn't have these, but Ctrl+C goes to the workers anyways
+            pass
+
+    await asyncio.gather(*[runWorker(i, b, shardCount, stopping, procs) for i,b in enumerate(blocks)])
+
+def main():
+    with open('lolotron_config.json', 'r') as f:
+        genSettings = json.loads(f.read())
+
+    log.setup(genSettings.get('logging'))
+    try:
+        asyncio.run(supervise(genSettings))
+    finally:
+        log.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import actor
+import asyncio
+import pytest
+
+'''
+Makes a job that records that it ran, yielding first so other jobs and submits get to go
+'''
+def makeJob(ran:list, name):
+    async def job():
+        await asyncio.sleep(0)
+        ran.append(name)
+    return job
+
+async def drain(queue:actor.ActorQueue):
+    while len(queue.actors) > 0:
+        await asyncio.sleep(0.001)
+
+def test_runsJobsInOrderPerKey():
+    async def run():
+        queue = actor.ActorQueue(maxDepth=100)
+        ran = {k:[] for k in range(3)}
+
+        for n in range(20):
+            for k in ran:
+                await queue.submit(k, makeJob(ran[k], n))
+        await drain(queue)
+
+        return ran,queue
+
+    ran,queue = asyncio.run(run())
+    assert all(v == list(range(20)) for v in ran.values())
+    assert queue.processed == 60
+    assert queue.blocked == 0
+
+def test_runsKeysInParallel():
+    async def run():
+        queue = actor.ActorQueue()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        ran = []
+
+        async def slow():
+            started.set()
+            await release.wait()
+
+        await queue.submit('slow', slow)
+        await started.wait()
+
+        # The other key goes ahead even though the first one is stuck
+        await queue.submit('fast', makeJob(ran, 'fast'))
+        await asyncio.sleep(0.01)
+        before = list(ran)
+
+        release.set()
+        await drain(queue)
+
+        return before
+
+    assert asyncio.run(run()) == ['fast']
+
+def test_submitWaitsForRoom():
+    async def run():
+        queue = actor.ActorQueue(maxDepth=2)
+        release = asyncio.Event()
+        ran = []
+
+        async def first():
+            await release.wait()
+            ran.append(0)
+
+        # One running and two waiting fills it up, so the next submit is held back
+        await queue.submit('k', first)
+        await asyncio.sleep(0)
+        await queue.submit('k', makeJob(ran, 1))
+        await queue.submit('k', makeJob(ran, 2))
+        held = asyncio.create_task(queue.submit('k', makeJob(ran, 3)))
+        await asyncio.sleep(0.01)
+        heldBefore = held.done()
+
+        release.set()
+        await held
+        await drain(queue)
+
+        return ran,heldBefore,queue
+
+    ran,heldBefore,queue = asyncio.run(run())
+    assert not heldBefore
+    assert ran == [0, 1, 2, 3]
+    assert queue.blocked == 1
+
+@pytest.mark.parametrize('burst', [1, 2, 4, 8])
+def test_keepsOrderWithBlockedSubmitters(burst:int):
+    async def run():
+        queue = actor.ActorQueue(maxDepth=2)
+        ran = {k:[] for k in range(3)}
+
+        # Each submit is its own task like the reaction listeners are. Yielding between bursts lets
+        # the queues drain while more submits arrive, so new submits race the ones held back
+        tasks = []
+        for n in range(40):
+            for k in ran:
+                tasks.append(asyncio.create_task(queue.submit(k, makeJob(ran[k], n))))
+            if n % burst == burst - 1:
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        await drain(queue)
+
+        return ran,queue
+
+    ran,queue = asyncio.run(run())
+    assert all(v == list(range(40)) for v in ran.values())
+    if burst > 1:
+        assert queue.blocked > 0
+
+def test_cancelledSubmitDropsItsJob():
+    async def run():
+        queue = actor.ActorQueue(maxDepth=1)
+        release = asyncio.Event()
+        ran = []
+
+        async def first():
+            await release.wait()
+            ran.append(0)
+
+        await queue.submit('k', first)
+        await asyncio.sleep(0)
+        await queue.submit('k', makeJob(ran, 1))
+        cancelled = asyncio.create_task(queue.submit('k', makeJob(ran, 2)))
+        kept = asyncio.create_task(queue.submit('k', makeJob(ran, 3)))
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        release.set()
+        await kept
+        await drain(queue)
+
+        return ran,cancelled
+
+    ran,cancelled = asyncio.run(run())
+    assert cancelled.cancelled()
+    assert ran == [0, 1, 3]
+
+def test_failedJobsDontStopTheKey():
+    async def run():
+        queue = actor.ActorQueue()
+        ran = []
+
+        async def fail():
+            raise RuntimeError('boom')
+
+        await queue.submit('k', fail)
+        await queue.submit('k', makeJob(ran, 'after'))
+        await drain(queue)
+
+        return ran,queue
+
+    ran,queue = asyncio.run(run())
+    assert ran == ['after']
+    assert queue.failed == 1
+    assert queue.stats()['actors'] == 0
@@ -1,69 +1,109 @@
+import actor
 import asyncio
-from collections import namedtuple
 from dataclasses import dataclass
-from datetime import datetime,timedelta
+from datetime import datetime,timedelta,timezone
 import disnake
 from disnake.ext import commands
 from enum import Enum, auto
 import extmessage
-import json
+import heapq
+import journal
+import log
+import membercache
+import metrics
+import render
+import statestore
+import time
 from typing import Any,Dict,List,Tuple
 
+logger = log.getLogger('tracker')
+
+'''
+Emoji keys are shared between every entry that uses them rather than each entry keeping its own copy
+'''
+_emojiKeys = {}
+
+'''
+Normalizes an emoji into something that can be hashed and compared cheaply. Custom emojis are
+identified by their ID (their name can change) and unicode emojis by the emoji itself
+'''
+def emojiKey(react) -> int or str:
+    if isinstance(react, (int, str)):
+        key = react
+    elif react.id is None:
+        key = react.name
+    else:
+        key = react.id
+
+    return _emojiKeys.setdefault(key, key)
+
 '''
-A convenience container for unpacking a rawReactionPayload from IDs to discord objects
+Whether a failed lookup from the server is worth trying again, like a timeout, a server error or
+being rate limited. Anything else, like the message being deleted, will fail the same way again
 '''
-_rawReactionPayload = namedtuple('_rawReactionPayload', ['user', 'guild', 'channel', 'message', 'emoji'])
+def isTransient(e:Exception) -> bool:
+    if isinstance(e, disnake.HTTPException):
+        return (e.status >= 500) or (e.status == 429)
+
+    return isinstance(e, (asyncio.TimeoutError, OSError))
+
+'''
+Stands in for the owner of a tracked item who has left the server, so the item keeps being tracked.
+This has the parts of a Member that tracked items use, named after the user if they are cached
+'''
+class departedOwner(disnake.Object):
+    def __init__(self, id:int, guild:disnake.Guild, user:disnake.User=None):
+        super().__init__(id)
+        self.guild = guild
+        self.display_name = user.display_name if user is not None else 'a former member'
+
+    @property
+    def mention(self) -> str:
+        return '<@{}>'.format(self.id)
 
 '''
 An entry in the tracker. These are essentially timestamped reacts. Since discord
 does not actually do any real accounting for these, we allow for tracking creation
 and removal via the valid field.
+
+Entries are never thrown away, so they are kept as small as possible and only hold IDs. Anything
+that needs to display an entry has to look up the user itself (see reactTracker.resolveUsers).
+
+Fields are as follows:
+userId    - The ID of the user who reacted
+react     - The emojiKey of the react
+timeStamp - Epoch time in seconds of when the react was made
+valid     - False once the react has been removed
 '''
 @dataclass
 class trackerEntry:
-    user:       disnake.Member
-    react:      disnake.Emoji or str
-    timeStamp:  datetime
+    __slots__ = ('userId', 'react', 'timeStamp', 'valid')
+
+    userId:     int
+    react:      int or str
+    timeStamp:  float
     valid:      bool
 
     @staticmethod
     def encode(data) -> Dict[str, Any]:
         rtnData = {}
 
-        rtnData['user'] = data.user.id
+        rtnData['user'] = data.userId
 
         if isinstance(data.react, str):
             rtnData['reactType'] = 'unicode'
-            rtnData['react'] = data.react
-        elif data.react.id is None:
-            rtnData['reactType'] = 'unicode'
-            rtnData['react'] = data.react.name
         else:
             rtnData['reactType'] = 'emoji'
-            rtnData['react'] = data.react.id
+        rtnData['react'] = data.react
 
-        rtnData['timeStamp'] = data.timeStamp.timestamp()
+        rtnData['timeStamp'] = data.timeStamp
         rtnData['valid']     = data.valid
 
         return rtnData
 
     @classmethod
-    def decode(cls, client:commands.Bot, data:Dict[str, Any]):
-        user  = client.get_user(data['user'])
-
-        if data['reactType'] == 'unicode':
-            react = data['react']
-        elif data['reactType'] == 'emoji':
-            react = client.get_emoji(data['react'])
-            if react is None:
-                print('Couldnt find emoji with ID {}'.format(data['react']))
-        else:
-            react = None
-
-        timeStamp = datetime.fromtimestamp(data['timeStamp'])
-        valid = data['valid']
-
-        return trackerEntry(user, react, timeStamp, valid)
+    def decode(cls, data:Dict[str, Any]):
+        return trackerEntry(data['user'], emojiKey(data['react']), data['timeStamp'], data['valid'])
 
 '''
 A tracked item. This is essentially the message the bot will create, and a list of
@@ -77,9 +117,21 @@ entries   - A list of trackerEntry which are reactions
 expire    - A datetime in UTC for when we will stop tracking this item
 cogData   - Cog defined data
 cogOwner  - The name of the registered Cog to lookup the function for callback
+
+The entries are an audit log and are never removed from. Alongside them is validIndex, which maps
+(user ID, emojiKey) to the position of the valid entry for that pair so that reactions can be matched
+without scanning the log. Entries should be added and invalidated through addEntry and
+invalidateEntry to keep the index up to date.
+
+Items restored from a save start out without anything looked up from the server. Their owner is
+only a disnake.Object with the ID, msgObj is None and saved holds what is needed to look them up.
+Reactions can be tracked on them like this, but anything else needs reactTracker.fetchTrackedItem
+first. Once they have been looked up, saved is None.
 '''
 @dataclass
 class Tracker:
+    __slots__ = ('owner', 'message', 'msgObj', 'entries', 'expire', 'cogData', 'cogOwner', 'validIndex', 'saved')
+
     owner:      disnake.Member
     message:    str
     msgObj:     disnake.Message
@@ -88,8 +140,64 @@ class Tracker:
     cogData:    Any
     cogOwner:   str
 
+    # validIndex and saved aren't fields, the index is built from the entries
+    def __post_init__(self):
+        self.saved = None
+        self.reindexEntries()
+
+    '''
+    Rebuilds the index of valid entries from scratch
+    '''
+    def reindexEntries(self):
+        self.validIndex = {}
+        for idx,e in enumerate(self.entries):
+            if e.valid:
+                self.validIndex[(e.userId, e.react)] = idx
+
+    '''
+    Finds the valid entry for the user and emoji. Returns the index of the entry and the entry,
+    or None for both if there isn't one
+    '''
+    def findEntry(self, userId:int, react) -> Tuple[int, trackerEntry]:
+        idx = self.validIndex.get((userId, emojiKey(react)))
+        if idx is None:
+            return None,None
+
+        return idx,self.entries[idx]
+
+    '''
+    Adds a valid entry to the end of the log. Returns the index of the entry
+    '''
+    def addEntry(self, entry:trackerEntry) -> int:
+        idx = len(self.entries)
+        self.entries.append(entry)
+        if entry.valid:
+            self.validIndex[(entry.userId, entry.react)] = idx
+
+        return idx
+
+    '''
+    Invalidates the entry at the index. The entry stays in the log for auditing
+    '''
+    def invalidateEntry(self, idx:int):
+        entry = self.entries[idx]
+        entry.valid = False
+
+        key = (entry.userId, entry.react)
+        if self.validIndex.get(key) == idx:
+            self.validIndex.pop(key)
+
     @staticmethod
     def encode(data) -> Dict[str, Any]:
+        # Items that haven't been looked up yet still have everything they were saved with
+        if data.saved is not None:
+            rtnData = dict(data.saved)
+            rtnData['msg']      = data.message
+            rtnData['entries']  = [trackerEntry.encode(e) for e in data.entries]
+            rtnData['expire']   = Tracker.encodeExpire(data.expire)
+            rtnData['cogOwner'] = data.cogOwner
+            return rtnData
+
         rtnData = {}
 
         rtnData['owner'] = data.owner.id
@@ -97,80 +205,215 @@ class Tracker:
         rtnData['msg']   = data.message
         rtnData['msgId'] = data.msgObj.id
 
+        # Keep where the message lives so it can be looked up directly when restoring
+        # Extended Message Objects also need all the messages they are made of
+        if isinstance(data.msgObj, extmessage.ExtMessage):
+            rtnData['channel'] = data.msgObj.msgObjs[-1].channel.id
+            rtnData['extMsg']  = data.msgObj.msg
+            rtnData['msgIds']  = [m.id for m in data.msgObj.msgObjs]
+        else:
+            rtnData['channel'] = data.msgObj.channel.id
+
         rtnData['entries'] = []
         for e in data.entries:
             rtnData['entries'].append(trackerEntry.encode(e))
 
-        rtnData['expire'] = data.expire.timestamp()
+        rtnData['expire'] = Tracker.encodeExpire(data.expire)
         rtnData['cogOwner'] = data.cogOwner
 
         return rtnData
 
+    '''
+    Expiration times are naive datetimes in UTC
+    '''
+    @staticmethod
+    def encodeExpire(expire:datetime) -> float:
+        return expire.replace(tzinfo=timezone.utc).timestamp()
+
+    '''
+    Restores a saved item without looking anything up from the server. See resolve
+    '''
     @classmethod
-    async def decode(cls, client:commands.Bot, data:Dict[str, Any]):
-        ownerGuild = await client.fetch_guild(data['ownerGuild'])
-        owner = await ownerGuild.fetch_member(data['owner'])
-
-        message = data['msg']
-
-        # There is no easy way to lookup a message given an ID. So
-        # instead we must search through all channels we can see, and
-        # try to find if they contain the message
-        for c in client.get_all_channels():
-            for tc in c.text_channels:
-                print(tc)
+    def decode(cls, data:Dict[str, Any]):
+        # Entries only hold IDs, so there is nothing to look up for them
+        entries = [trackerEntry.decode(e) for e in data['entries']]
+
+        expire = datetime.utcfromtimestamp(data['expire'])
+        cogOwner = data['cogOwner']
+
+        t = Tracker(disnake.Object(data['owner']), data['msg'], None, entries, expire, None, cogOwner)
+
+        # The entries are kept on the item itself, so don't hold onto them twice
+        t.saved = {k:v for k,v in data.items() if k != 'entries'}
+        return t
+
+    '''
+    Looks up the owner and message of a saved item from the server. Returns them as (owner, msgObj).
+    Owners are looked up through the member cache if one is given, which batches lookups together
+    '''
+    @staticmethod
+    async def resolve(client:commands.Bot, data:Dict[str, Any], members:membercache.MemberCache=None):
+        guildId = data['ownerGuild']
+
+        ownerGuild = client.get_guild(guildId)
+        if ownerGuild is None:
+            with metrics.api('fetch_guild', guildId):
+                ownerGuild = await client.fetch_guild(guildId)
+
+        if members is not None:
+            owner = (await members.resolve(ownerGuild, [data['owner']])).get(data['owner'])
+        else:
+            owner = ownerGuild.get_member(data['owner'])
+        if owner is None:
+            try:
+                with metrics.api('fetch_member', guildId):
+                    owner = await ownerGuild.fetch_member(data['owner'])
+            except disnake.NotFound:
+                # The owner has left, but their event is still going
+                owner = departedOwner(data['owner'], ownerGuild, client.get_user(data['owner']))
+
+        # Items saved before we kept track of the channel need to be searched for. The message
+        # has to be in the guild it was created in, so only those channels need to be checked
+        if 'channel' in data:
+            channel = client.get_channel(data['channel'])
+            if channel is None:
+                with metrics.api('fetch_channel', guildId):
+                    channel = await client.fetch_channel(data['channel'])
+        else:
+            for tc in ownerGuild.text_channels:
                 try:
-                    msgObj = await tc.fetch_message(data['msgId'])
-                except:
+                    with metrics.api('fetch_message', guildId):
+                        await tc.fetch_message(data['msgId'])
+                except disnake.HTTPException:
                     continue
                 else:
+                    channel = tc
                     break
             else:
-                continue
-
-            break
+                raise LookupError('Could not find message {} in any channel'.format(data['msgId']))
+
+        if 'msgIds' in data:
+            msgObj = extmessage.ExtMessage(msgCnt=len(data['msgIds']), msgRsv=0, msg=data['extMsg'])
+            msgObj.msgCnt  = len(data['msgIds'])
+            async def fetchPart(m):
+                with metrics.api('fetch_message', guildId):
+                    return await channel.fetch_message(m)
+            msgObj.msgObjs = list(await asyncio.gather(*[fetchPart(m) for m in data['msgIds']]))
+            msgObj.rendered= [m.content for m in msgObj.msgObjs]
+            msgObj.id      = msgObj.msgObjs[-1].id
         else:
-            msgObj = None
-
-        entries = []
-        for e in data['entries']:
-            entries.append(trackerEntry.decode(client, e))
-
-        expire = datetime.utcfromtimestamp(data['expire'])
-        cogOwner = data['cogOwner']
+            with metrics.api('fetch_message', guildId):
+                msgObj = await channel.fetch_message(data['msgId'])
 
-        return Tracker(owner, message, msgObj, entries, expire, None, cogOwner)
+        return owner,msgObj
 
 '''
 A Cog that tracks reactions to a message
 '''
 class reactTracker(commands.Cog):
-    jsonFileName = 'reactTracker.json'
-
     def __init__(self, bot, settings):
         self.bot = bot
 
         self.trackedItems = {}
+        # Index of every message ID that belongs to a tracked item, pointing at the ID the item is
+        # stored under. This is checked against the raw payload before anything is resolved so that
+        # reactions on untracked messages are free. The reverse lookup lets us drop an item from the
+        # index without scanning it
+        self.msgIndex = {}
+        self.msgIndexRev = {}
+
+        # Expiration times are kept in a min-heap of (expire, itemId) so the next item to expire can be
+        # found without scanning everything. Extending or deleting an item doesn't remove its old heap
+        # entry, instead expireSched holds the only expiration that is still valid for each item and
+        # anything else popped off the heap is ignored
+        self.expireHeap = []
+        self.expireSched = {}
+        self.expireWake = asyncio.Event()
+
         self.msgCb = {}
         self.procCb = {}
-
-        # Disable loading of saved reactTracker settings
-        # It's not used very often, and is currently partially broken with extended messages
-        #bot.loop.create_task(self.load_settings())
+        self.entryCb = {}
+
+        # Message callbacks re-render the message, which can be expensive and is rate limited by Discord.
+        # Bursts of reactions are collapsed into a single callback per tracked item, and the callbacks
+        # run on their own workers so handling reactions never waits on Discord
+        self.renderer = render.RenderScheduler(debounce  =settings.get('renderDebounce', 1.0),
+                                               maxLatency=settings.get('renderMaxLatency', 5.0),
+                                               workers   =settings.get('renderWorkers', 4),
+                                               groupLimit=settings.get('renderCogLimit', None),
+                                               retries   =settings.get('renderRetries', 3),
+                                               retryDelay=settings.get('renderRetryDelay', 1.0))
+        self.renderRequested = {}
+
+        # Every change to the tracked items is recorded so they can be restored after a restart.
+        # When sharded across processes, they all share a database and each only has its own guilds
+        shardIds = getattr(bot, 'shard_ids', None)
+        if (settings.get('stateStore') is not None) or (shardIds is not None):
+            self.journal = statestore.StateStore(dbFile        =settings.get('stateStore', 'reactTracker.db'),
+                                                 shardIds      =shardIds,
+                                                 shardCount    =getattr(bot, 'shard_count', None) or 1,
+                                                 syncInterval  =settings.get('journalSyncInterval', 1.0),
+                                                 compactRecords=settings.get('journalCompactRecords', 10000))
+        else:
+            self.journal = journal.Journal(journalFile   =settings.get('journalFile', 'reactTracker.journal'),
+                                           snapshotFile  =settings.get('snapshotFile', 'reactTracker.snapshot.json'),
+                                           syncInterval  =settings.get('journalSyncInterval', 1.0),
+                                           compactRecords=settings.get('journalCompactRecords', 10000))
+
+        # How many saved items to look up from the server at once when restoring
+        self.restoreConcurrency = settings.get('restoreConcurrency', 8)
+        # Lookups that fail because Discord is having trouble are tried again, backing off each time
+        self.restoreRetries    = settings.get('restoreRetries', 3)
+        self.restoreRetryDelay = settings.get('restoreRetryDelay', 1.0)
+
+        # Reactions for the same tracked item are handled one at a time, in the order they came in,
+        # so an add and a remove that race each other can't interleave across their awaits
+        self.actors = actor.ActorQueue(maxDepth=settings.get('actorQueueDepth', 100))
+
+        # Reactions can be missed while we are disconnected, so tracked items are checked against the
+        # reactions actually on their messages when we reconnect. This is how many are checked at once
+        self.reconcileSem = asyncio.Semaphore(settings.get('reconcileConcurrency', 4))
+        self.loaded = False
+        # Whether load_settings has done the reconcile for the first ready
+        self.reconciled = False
+
+        # Members we have looked up for display, since entries only keep their IDs. This is shared by
+        # everything that needs to show a user
+        self.members = membercache.MemberCache(ttl        =settings.get('memberCacheTtl', 3600.0),
+                                               negativeTtl=settings.get('memberCacheNegativeTtl', 300.0),
+                                               maxSize    =settings.get('memberCacheSize', 5000))
+
+        # Saved items that couldn't be restored. These are kept around (and saved again) until they
+        # expire in case the failure was temporary
+        self.unrestored = {}
+
+        # Restored items being looked up from the server, by the ID they are stored under
+        self.hydrating = {}
+
+        # Items whose message was just looked up and hasn't had a reaction since, so its reactions
+        # are still current and reconciling it doesn't need to look it up again
+        self.freshMessages = set()
+
+        # Writes the journal in the background once everything is loaded
+        self.journalTask = None
+
+        bot.loop.create_task(self.load_settings())
         bot.loop.create_task(self.gc_task())
 
     '''
     Adds a lookup for a Cog to a callback function
+    The optional entry callback is called with the tracked item and the entry every time an
+    entry is added or invalidated, so the Cog can keep its own state up to date incrementally. It
+    can return False if the change doesn't affect the message, so it isn't updated for nothing
     '''
-    def registerCallbacks(self, name, msgCb, procCb):
+    def registerCallbacks(self, name, msgCb, procCb, entryCb=None):
         self.msgCb[name]  = msgCb
         self.procCb[name] = procCb
+        if entryCb is not None:
+            self.entryCb[name] = entryCb
 
-        print('Message Callback table is now:')
-        print(self.msgCb)
-
-        print('Process Callback table is now:')
-        print(self.procCb)
+        logger.debug('Message Callback table is now: %s', self.msgCb)
+        logger.debug('Process Callback table is now: %s', self.procCb)
 
     '''
     Creates a tracked object
@@ -185,9 +428,75 @@ class reactTracker(commands.Cog):
 
         t = Tracker(user, msg, msgObj, [], expireTime, usrdata, cogOwner)
 
-        self.trackedItems[msgObj.id] = t
+        # The owner is usually shown with the entries, so we might as well keep them around
+        if isinstance(user, disnake.Member):
+            self.members.put(user.guild.id, user)
+
+        self._addTrackedItem(msgObj.id, t)
+        self.journal.append('c', msgObj.id, d=Tracker.encode(t))
         return t
 
+    '''
+    Starts tracking an item. This is shared by creating new items and restoring saved ones
+    '''
+    def _addTrackedItem(self, itemId, item:Tracker):
+        self.trackedItems[itemId] = item
+        self._indexTrackedItem(itemId, item)
+        self._scheduleExpire(itemId, item.expire)
+
+    '''
+    Adds all the message IDs that make up a tracked item to the message index
+    '''
+    def _indexTrackedItem(self, itemId, item:Tracker):
+        msgIds = {itemId}
+
+        # Extended Message Objects are made up of multiple messages that can all be reacted to. They
+        # can also be (re)created or deleted after being tracked, so have them tell us when that happens
+        if isinstance(item.msgObj, extmessage.ExtMessage):
+            msgIds.update(m.id for m in item.msgObj.msgObjs)
+            item.msgObj.idCb = lambda added, removed: self._reindexTrackedItem(itemId, added, removed)
+        elif item.saved is not None:
+            msgIds.update(item.saved.get('msgIds', []))
+
+        self._reindexTrackedItem(itemId, msgIds, [])
+
+    '''
+    Updates the message IDs that point at a tracked item in the message index
+    '''
+    def _reindexTrackedItem(self, itemId, added, removed):
+        msgIds = self.msgIndexRev.setdefault(itemId, set())
+
+        for m in removed:
+            # The item's own ID must always stay in the index while it is being tracked
+            if m == itemId:
+                continue
+            msgIds.discard(m)
+            self.msgIndex.pop(m, None)
+
+        for m in added:
+            msgIds.add(m)
+            self.msgIndex[m] = itemId
+
+    '''
+    Removes all the message IDs that point at a tracked item from the message index
+    '''
+    def _unindexTrackedItem(self, itemId):
+        for m in self.msgIndexRev.pop(itemId, ()):
+            self.msgIndex.pop(m, None)
+        self.freshMessages.discard(itemId)
+
+    '''
+    Looks up the tracked item that a message belongs to. The message can be any of the messages
+    that make up the tracked item. Returns the ID the item is stored under and the item, or None
+    for both if the message isn't being tracked
+    '''
+    def lookupTrackedItem(self, msgId) -> Tuple[int, Tracker]:
+        itemId = self.msgIndex.get(msgId)
+        if itemId is None:
+            return (None, None)
+
+        return (itemId, self.trackedItems.get(itemId))
+
     '''
     An accessor function to get the tracked object or return None if it
     doesn't exist
@@ -198,6 +507,84 @@ class reactTracker(commands.Cog):
         else:
             return self.trackedItems[msgId]
 
+    '''
+    Like getTrackedItem, but also makes sure a restored item has been looked up from the server so
+    its owner and message can be used. Returns None if it isn't tracked or couldn't be looked up
+    '''
+    async def fetchTrackedItem(self, msgId) -> Tracker:
+        event = self.trackedItems.get(msgId)
+        if (event is None) or (event.saved is None):
+            return event
+
+        # Everyone asking for the same item waits on the same lookup
+        task = self.hydrating.get(msgId)
+        if task is None:
+            task = self.bot.loop.create_task(self._hydrate(msgId, event))
+            self.hydrating[msgId] = task
+        return await asyncio.shield(task)
+
+    async def _hydrate(self, itemId, event:Tracker) -> Tracker:
+        try:
+            attempt = 0
+            while True:
+                try:
+                    with metrics.span('hydrate', guild=self._guildId(event), cog=event.cogOwner):
+                        owner,msgObj = await Tracker.resolve(self.bot, event.saved, self.members)
+                    break
+                except Exception as e:
+                    attempt += 1
+                    if not isTransient(e):
+                        # Keep it around like it is in the save, in case it can be looked up after a restart
+                        logger.warning('Could not restore tracked item %s: %s', itemId, e)
+                        if self.trackedItems.get(itemId) is event:
+                            self.unrestored[itemId] = Tracker.encode(event)
+                            self.trackedItems.pop(itemId)
+                            self._unindexTrackedItem(itemId)
+                            self.expireSched.pop(itemId, None)
+                            self.renderer.cancel(itemId)
+                        return None
+
+                    # Discord is having trouble, so keep tracking it from the save. Whatever needs
+                    # it next will try again if we run out of attempts here
+                    if attempt > self.restoreRetries:
+                        logger.warning('Could not look up tracked item %s after %d attempts, will try again later: %s',
+                                       itemId, attempt, e)
+                        return None
+
+                    delay = self.restoreRetryDelay * 2 ** (attempt - 1)
+                    logger.info('Looking up tracked item %s failed, trying again in %.1fs: %s', itemId, delay, e)
+                    await asyncio.sleep(delay)
+        finally:
+            self.hydrating.pop(itemId, None)
+
+        event.owner  = owner
+        event.msgObj = msgObj
+        event.saved  = None
+
+        if self.trackedItems.get(itemId) is not event:
+            return None
+        self.freshMessages.add(itemId)
+
+        # Extended messages need to tell us about changes to their messages from now on
+        self._indexTrackedItem(itemId, event)
+        return event
+
+    '''
+    Looks up restored items from the server in the background, starting with the ones that expire
+    soonest. Anything that is needed sooner is looked up right away by fetchTrackedItem instead
+    '''
+    async def prefetch(self):
+        pending = sorted((v.expire, k) for k,v in self.trackedItems.items() if v.saved is not None)
+        order = iter(pending)
+
+        async def worker():
+            for _,k in order:
+                await self.fetchTrackedItem(k)
+
+        with metrics.span('prefetch'):
+            await asyncio.gather(*[worker() for _ in range(self.restoreConcurrency)])
+        logger.info('Looked up %d restored items', len(pending))
+
     '''
     An accessor function to safely delete a tracked item before it expires
     This removes the item from being tracked, but does nothing to the message
@@ -209,194 +596,575 @@ class reactTracker(commands.Cog):
         except:
             return
 
+        self._unindexTrackedItem(msgId)
+        self.expireSched.pop(msgId, None)
+        self.journal.append('d', msgId)
+
+        # Drop any render still waiting for an item we're no longer tracking, since its message may
+        # be about to go away. Flush first if it should still go out
+        self.renderer.cancel(msgId)
+
+    '''
+    Pushes back the expiration of a tracked item by the given amount of time
+    '''
+    def extendTrackedItem(self, msgId, extTime:timedelta):
+        event = self.getTrackedItem(msgId)
+        if event is None:
+            return
+
+        event.expire += extTime
+        self._scheduleExpire(msgId, event.expire)
+        self.journal.append('x', msgId, x=Tracker.encodeExpire(event.expire))
+
+    '''
+    Replaces the user's message for a tracked item. The Cog is responsible for reparsing it
+    '''
+    def updateTrackedMessage(self, msgId, msg:str):
+        event = self.getTrackedItem(msgId)
+        if event is None:
+            return
+
+        event.message = msg
+        self.journal.append('m', msgId, m=msg)
+
+    '''
+    Adds an item's expiration to the expiration heap, replacing any previous one
+    '''
+    def _scheduleExpire(self, itemId, expire:datetime):
+        self.expireSched[itemId] = expire
+        heapq.heappush(self.expireHeap, (expire, itemId))
+
+        # Stale entries are only dropped when they reach the top of the heap. If there are a lot
+        # of them (from lots of extends) rebuild the heap with just the valid ones
+        if len(self.expireHeap) > (2 * len(self.expireSched)) + 64:
+            self.expireHeap = [(v,k) for k,v in self.expireSched.items()]
+            heapq.heapify(self.expireHeap)
+
+        # Wake up the GC task if this is now the next thing to expire
+        if self.expireHeap[0][1] == itemId:
+            self.expireWake.set()
+
+    '''
+    Lets the Cog who created the tracked item know that one of its entries changed. Returns whether
+    the message needs to be updated for it
+    '''
+    def _entryChanged(self, event:Tracker, entry:trackerEntry) -> bool:
+        if (event.cogOwner is not None) and (event.cogOwner in self.entryCb):
+            return self.entryCb[event.cogOwner](event, entry) is not False
+        return True
+
+    '''
+    Requests that the Cog who created the tracked item updates the message. Requests are
+    debounced, so this returns right away and the callback runs later with the latest state.
+    Urgent requests skip the debounce and run as soon as possible
+    '''
+    def requestRender(self, itemId, event:Tracker, urgent:bool=False):
+        if (event.cogOwner is None) or (event.cogOwner not in self.msgCb):
+            return
+
+        # Keep when the oldest request that hasn't been rendered came in, to see how long renders are held back
+        self.renderRequested.setdefault(itemId, time.perf_counter())
+
+        cb = self.msgCb[event.cogOwner]
+        self.renderer.schedule(itemId, lambda: self._render(itemId, event, cb), group=event.cogOwner)
+
+        if urgent:
+            self.renderer.expedite(itemId)
+
+    async def _render(self, itemId, event:Tracker, cb):
+        guildId = self._guildId(event)
+
+        # Restored items have to be looked up before their message can be updated
+        if event.saved is not None:
+            event = await self.fetchTrackedItem(itemId)
+            if event is None:
+                self.renderRequested.pop(itemId, None)
+                return
+
+        requested = self.renderRequested.pop(itemId, None)
+        if requested is not None:
+            metrics.observe('render_wait', time.perf_counter() - requested, guild=guildId, cog=event.cogOwner)
+
+        with metrics.span('render', guild=guildId, cog=event.cogOwner):
+            await cb(event)
+
+    '''
+    The ID of the guild a tracked item is in, for metrics
+    '''
+    @staticmethod
+    def _guildId(event:Tracker) -> int:
+        if event.saved is not None:
+            return event.saved['ownerGuild']
+        guild = getattr(event.owner, 'guild', None)
+        return None if guild is None else guild.id
+
+    '''
+    Runs any pending message update for the tracked item right away and waits for it to finish
+    '''
+    async def flushRender(self, msgId):
+        await self.renderer.flush(msgId)
+
+    '''
+    Flushes anything that hasn't been written out yet. This should be awaited before the bot
+    disconnects
+    '''
+    async def shutdown(self):
+        await self.renderer.flushAll()
+        self.renderer.close()
+
+        # Leave a snapshot behind so the next start doesn't have to replay the journal
+        # The journal isn't open if we never finished loading, and then there's nothing new to save
+        if self.journal.fd is not None:
+            await self.journal.snapshot(self._encodeState)
+            self.journal.close()
+
+        # Nothing else can be written once the journal is closed
+        if self.journalTask is not None:
+            self.journalTask.cancel()
+
     '''
-    A scheduled task to load previously saved setttings. This must be its own
+    A scheduled task to load previously saved tracked items. This must be its own
     function rather than being done at startup becuase we need to do some
     async lookups from the server, which cannot be dont in _init_
     '''
     async def load_settings(self):
-        # Need to wait until we're actually connected so we can do some of the lookups
+        # Rebuilding the saved state doesn't need the server, so get it done right away
+        try:
+            state = self.journal.replay()
+        except Exception:
+            logger.exception('Could not replay the journal, nothing will be saved')
+            return
+
+        # Everything is restored from the IDs in the save right away so reactions can be tracked as
+        # soon as we connect. The owners and messages are looked up from the server later
+        with metrics.span('restore'):
+            self.restore(state)
+
+        logger.info('Restored %d tracked items', len(self.trackedItems))
+
+        metrics.registry.addCollector(self._collectMetrics)
+        self.loaded = True
+
+        # Snapshots keep what restored items were saved with until they are looked up, so they can
+        # start right away
+        self.journalTask = self.bot.loop.create_task(self.journal_task())
+
+        # Need to wait until we're actually connected to look anything up
         await self.bot.wait_until_ready()
+        await self.prefetch()
 
-        try:
-            with open(self.jsonFileName, 'r') as f:
-                jsonData = json.loads(f.read())
+        # Anything that happened while we were down was missed, so catch up on it
+        await self.reconcileAll()
+        self.reconciled = True
 
-            for k,v in jsonData.items():
-                t = await Tracker.decode(self.bot, v)
-                self.trackedItems[int(k)] = t
+    '''
+    Starts tracking saved items, without looking anything up from the server
+    '''
+    def restore(self, state:Dict[int, Dict[str, Any]]):
+        for k,v in state.items():
+            try:
+                t = Tracker.decode(v)
+            except Exception as e:
+                logger.warning('Could not restore tracked item %s: %s', k, e)
+                self.unrestored[k] = v
+                continue
 
-        except Exception as e:
-            print('loading exception')
-            print(e)
-            pass
+            self._addTrackedItem(k, t)
 
         # Call registered process handlers for all the items now
         for k,v in self.trackedItems.items():
             if (v.cogOwner is not None) and (v.cogOwner in self.procCb):
-                self.procCb[v.cogOwner](v)
+                with metrics.span('process', guild=self._guildId(v), cog=v.cogOwner):
+                    self.procCb[v.cogOwner](v)
+
+    '''
+    Values we already keep track of, exported as metrics
+    '''
+    def _collectMetrics(self):
+        yield 'tracked_items', {}, len(self.trackedItems)
+        yield 'unrestored_items', {}, len(self.unrestored)
+        yield 'unfetched_items', {}, sum(1 for v in self.trackedItems.values() if v.saved is not None)
+        yield 'render_pending', {}, len(self.renderRequested)
+        yield 'journal_pending', {}, len(self.journal.pending)
+
+        for k,v in self.actors.stats().items():
+            yield 'reaction_queue_' + k, {}, v
 
-        # Debug info
-        print(self.trackedItems)
+        for k,v in self.renderer.stats().items():
+            yield 'render_queue_' + k, {}, v
+
+        for k,v in self.members.stats().items():
+            yield 'member_cache_' + k, {}, v
 
     '''
-    A task that periodically runs the garbage collector
+    Shows where the time is going. Only the bot owner can use this
+    '''
+    @commands.command(brief='Shows performance stats for the bot')
+    @commands.is_owner()
+    async def stats(self, ctx):
+        lines = []
+        lines.append('Tracked items: {} ({} unrestored)'.format(len(self.trackedItems), len(self.unrestored)))
+
+        q = self.actors.stats()
+        lines.append('Reaction queues: {} active, {} waiting, {} handled, {} failed, lag avg {:.1f}ms max {:.1f}ms'.format(
+            q['actors'], q['depth'], q['processed'], q['failed'], q['lagAvg'] * 1e3, q['lagMax'] * 1e3))
+
+        m = self.members.stats()
+        lines.append('Member cache: {} cached, {} hits, {} misses, {} lookups'.format(
+            m['size'], m['hits'], m['misses'], m['queries']))
+
+        lines.append('')
+        lines.append('{:<34} {:>7} {:>9} {:>9} {:>9}'.format('span', 'count', 'mean', 'p50<=', 'p99<='))
+        for name,count,mean,p50,p99 in metrics.registry.summary(keep=('route', 'type')):
+            lines.append('{:<34} {:>7} {:>7.1f}ms {:>7.1f}ms {:>7.1f}ms'.format(name[:34], count, mean * 1e3, p50 * 1e3, p99 * 1e3))
+
+        # Stay inside of a single message
+        msg = '\n'.join(lines)
+        if len(msg) > 1900:
+            msg = msg[:1900] + '\n...'
+
+        await ctx.send('```\n{}\n```'.format(msg))
+
+    '''
+    A task that periodically makes the journal durable, and compacts it when it gets too big
+    '''
+    async def journal_task(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.journal.syncInterval)
+
+            try:
+                if await self.journal.sync():
+                    await self.journal.snapshot(self._encodeState)
+            except Exception:
+                logger.exception('Failed to write the journal')
+
+    '''
+    Encodes everything we are tracking for a journal snapshot
+    '''
+    def _encodeState(self) -> Dict[int, Dict[str, Any]]:
+        state = {k:Tracker.encode(v) for k,v in self.trackedItems.items()}
+
+        # Keep anything we couldn't restore until it would have expired anyways
+        cTime = Tracker.encodeExpire(datetime.utcnow())
+        for k,v in self.unrestored.items():
+            if v['expire'] > cTime:
+                state[k] = v
+
+        return state
+
+    '''
+    A task that runs the garbage collector whenever the next tracked item expires
     '''
     async def gc_task(self):
         await self.bot.wait_until_ready()
 
         while not self.bot.is_closed():
-            print('Running GC from automated task')
+            self.expireWake.clear()
             self.gc()
-            # Sleep until time to run again
-            await asyncio.sleep(120)
+
+            # Sleep until the next item expires, or until something new is scheduled to expire first
+            if len(self.expireHeap) > 0:
+                timeout = max((self.expireHeap[0][0] - datetime.utcnow()).total_seconds(), 0)
+            else:
+                timeout = None
+
+            try:
+                await asyncio.wait_for(self.expireWake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
     '''
     A garbage collection function. This mainly cleans up the tracked list of expired
-    events
+    events. Only the top of the expiration heap is checked, so this is cheap to call
+    when nothing has expired
     '''
     def gc(self):
-        expiredList = []
+        with metrics.span('gc'):
+            self._gc()
+
+    def _gc(self):
         cTime = datetime.utcnow()
 
-        # Find all the tracking items that are expired
-        for k,v in self.trackedItems.items():
-            if v.expire <= cTime:
-                print('GC found an expired event with id {}'.format(k))
-                expiredList.append(k)
+        while (len(self.expireHeap) > 0) and (self.expireHeap[0][0] <= cTime):
+            expire,k = heapq.heappop(self.expireHeap)
+
+            # Skip entries for items that have been deleted or had their expiration changed
+            if self.expireSched.get(k) != expire:
+                continue
+
+            # The expiration may have been modified directly on the item rather than through
+            # extendTrackedItem, so reschedule it with whatever it says now
+            v = self.trackedItems[k]
+            if v.expire > cTime:
+                self._scheduleExpire(k, v.expire)
+                continue
 
-        # Remove all the expired events
-        for k in expiredList:
+            logger.info('GC found an expired event', extra=log.fields(itemId=k))
             self.trackedItems.pop(k)
+            self._unindexTrackedItem(k)
+            self.expireSched.pop(k)
+            self.journal.append('d', k)
+            self.renderer.expedite(k)
 
     '''
-    Converts a rawReactionActionEvent payload to objects
+    Starting a new session or resuming one after being disconnected means reactions in between
+    could have been missed. The first ready is handled by load_settings once everything is restored,
+    so these only catch up after that's done. Sharded bots catch up each shard on its own instead
     '''
-    async def _unpackRawReaction(self, payload:disnake.RawReactionActionEvent) -> _rawReactionPayload:
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if self.reconciled and not self._sharded():
+            await self.reconcileAll()
 
-        channel = self.bot.get_channel(payload.channel_id)
-        message = await channel.fetch_message(payload.message_id)
-        emoji   = payload.emoji
-        guild   = await self.bot.fetch_guild(payload.guild_id)
+    @commands.Cog.listener()
+    async def on_resumed(self):
+        if self.reconciled and not self._sharded():
+            await self.reconcileAll()
+
+    @commands.Cog.listener()
+    async def on_shard_ready(self, shardId:int):
+        if self.reconciled:
+            await self.reconcileAll(shardId)
 
-        # Try to look up the user in the guild to try to get the member
-        # but if it fails we'll need to fallback to using a standard user lookup
-        user = await guild.fetch_member(payload.user_id)
-        if user is None:
-            user = self.bot.get_user(payload.user_id)
+    @commands.Cog.listener()
+    async def on_shard_resumed(self, shardId:int):
+        if self.reconciled:
+            await self.reconcileAll(shardId)
 
-        return _rawReactionPayload(user, guild, channel, message, emoji)
+    def _sharded(self) -> bool:
+        return isinstance(self.bot, commands.AutoShardedBot)
 
     '''
-    Adds the user to the list of tracked events
+    Queues every tracked item to be reconciled, or only the ones in guilds on the shard if one is
+    given. Items are reconciled in order with the reactions to them, and only reconcileConcurrency
+    are looked up at once
+    '''
+    async def reconcileAll(self, shardId:int=None):
+        itemIds = list(self.trackedItems)
+        if shardId is not None:
+            # Discord puts a guild on shard (guild ID >> 22) % shard count
+            shardCount = getattr(self.bot, 'shard_count', None) or 1
+            itemIds = [k for k in itemIds if ((self._guildId(self.trackedItems[k]) or 0) >> 22) % shardCount == shardId]
+
+        logger.info('Reconciling %d tracked items', len(itemIds), extra=log.fields(shard=shardId))
+
+        for itemId in itemIds:
+            await self.actors.submit(itemId, lambda itemId=itemId: self.reconcile(itemId))
+
+    '''
+    Brings the entries of a tracked item in line with the reactions actually on its message. Only
+    the difference is applied: reactions we don't have are added to the end of the entries, and
+    entries for reactions that are gone are invalidated. Everything else is left as is so the
+    order and timestamps are kept. Returns the number of entries added and invalidated
+    '''
+    async def reconcile(self, itemId) -> Tuple[int, int]:
+        event = await self.fetchTrackedItem(itemId)
+        if event is None:
+            return 0,0
+
+        # Reactions to an extended message are only tracked on the last message
+        msgObj = event.msgObj
+        if isinstance(msgObj, extmessage.ExtMessage):
+            msgObj = msgObj.msgObjs[-1]
+
+        # Collect who has reacted with what, ignoring ourselves like the reaction handlers do
+        reacted = []
+        async with self.reconcileSem:
+            try:
+                # A message that was just looked up doesn't need to be looked up again. Fetched
+                # messages aren't updated as reactions come in, so otherwise get the latest
+                if itemId in self.freshMessages:
+                    self.freshMessages.discard(itemId)
+                    message = msgObj
+                else:
+                    with metrics.api('fetch_message', msgObj.guild.id):
+                        message = await msgObj.channel.fetch_message(msgObj.id)
+                for r in message.reactions:
+                    key = emojiKey(r.emoji)
+                    with metrics.api('reaction_users', msgObj.guild.id):
+                        async for u in r.users():
+                            if u.id != self.bot.user.id:
+                                reacted.append((u.id, key))
+            except disnake.HTTPException as e:
+                logger.warning('Could not reconcile tracked item %s: %s', itemId, e)
+                return 0,0
+
+        # The item may have been deleted while we were looking
+        if self.trackedItems.get(itemId) is not event:
+            return 0,0
+
+        reactedKeys = set(reacted)
+        changed = False
+        removed = 0
+        for key,idx in list(event.validIndex.items()):
+            if key not in reactedKeys:
+                event.invalidateEntry(idx)
+                self.journal.append('i', itemId, n=idx)
+                changed |= self._entryChanged(event, event.entries[idx])
+                removed += 1
+
+        added = 0
+        now = time.time()
+        for userId,key in reacted:
+            if (userId,key) not in event.validIndex:
+                newEntry = trackerEntry(userId, key, now, True)
+                event.addEntry(newEntry)
+                self.journal.append('a', itemId, e=trackerEntry.encode(newEntry))
+                changed |= self._entryChanged(event, newEntry)
+                added += 1
+
+        if (added > 0) or (removed > 0):
+            logger.info('Reconciled tracked item', extra=log.fields(itemId=itemId, added=added, removed=removed))
+        if changed:
+            self.requestRender(itemId, event)
+
+        return added,removed
+
+    '''
+    A cheap pre-filter that only uses the IDs in the raw payload. This lets us throw away reactions
+    on messages we don't care about (and our own reactions) before doing any lookups
+    '''
+    def _isTrackedReaction(self, payload:disnake.RawReactionActionEvent) -> bool:
+        if (self.bot.user is not None) and (payload.user_id == self.bot.user.id):
+            return False
+
+        return payload.message_id in self.msgIndex
+
+    '''
+    Looks up the users with the IDs for display. Users who aren't in the guild anymore, or that
+    couldn't be looked up, are left out
+    '''
+    async def resolveUsers(self, guild:disnake.Guild, userIds) -> Dict[int, disnake.abc.User]:
+        return await self.members.resolve(guild, userIds)
+
+    '''
+    Queues a reaction add to be handled in order with everything else on the same tracked item
     '''
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        # Unpack the parameters
-        uPayload = await self._unpackRawReaction(payload)
-        message  = uPayload.message
-        emoji    = uPayload.emoji
-        user     = uPayload.user
-
-        # Ignore ourselves
-        if user == self.bot.user:
+        # Ignore ourselves and anything we aren't tracking before doing any lookups
+        if not self._isTrackedReaction(payload):
             return
 
+        # Reaction adds come with the member attached, so hang on to it for when it is displayed
+        if payload.member is not None:
+            self.members.put(payload.guild_id, payload.member)
+
+        metrics.inc('reactions', guild=payload.guild_id, type='add')
+        await self.actors.submit(self.msgIndex[payload.message_id], lambda: self._handleReaction(self._reactionAdd, payload, 'add'))
+
+    '''
+    Queues a reaction remove to be handled in order with everything else on the same tracked item
+    '''
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload):
+        # Ignore ourselves and anything we aren't tracking before doing any lookups
+        if not self._isTrackedReaction(payload):
+            return
+
+        metrics.inc('reactions', guild=payload.guild_id, type='remove')
+        await self.actors.submit(self.msgIndex[payload.message_id], lambda: self._handleReaction(self._reactionRemove, payload, 'remove'))
+
+    '''
+    A summary of the reaction queues for monitoring
+    '''
+    def queueStats(self) -> Dict[str, Any]:
+        return self.actors.stats()
+
+    async def _handleReaction(self, handler, payload:disnake.RawReactionActionEvent, rType:str):
+        with metrics.span('reaction', guild=payload.guild_id, type=rType):
+            await handler(payload)
+
+    '''
+    Adds the user to the list of tracked events
+    '''
+    async def _reactionAdd(self, payload:disnake.RawReactionActionEvent):
+        # Entries only need the IDs, so nothing has to be looked up
+        msgId = payload.message_id
+        emoji = emojiKey(payload.emoji)
+
         # Run garbage collection so that we don't process expired events
         self.gc()
 
-        # Grab the message ID to see if we should even try to parse stuff
-        msgId = message.id
-
         # Skip modifying anything if we aren't tracking on this message
-        for itemId,item in self.trackedItems.items():
-            # Extended Message Objects need to have extra checks against all messages they contain
-            # We also need to locate the tracker item by the actual ID it's store as instead of potentially
-            # a message in the middle of the object
-            if isinstance(item.msgObj, extmessage.ExtMessage) and (item.msgObj.check_ids(msgId)):
-                event = self.trackedItems[item.msgObj.id]
-                break
-            # Normal discordPy Message Object can just match the itemId (the message ID)
-            elif itemId == msgId:
-                event = item
-                break
-        else:
-            print('Tracker Reaction Add: Could not find {:d} in the tracker so ignoring this'.format(msgId))
+        # Extended Message Objects are indexed by all the messages they contain, so this locates the
+        # tracker item by the actual ID it's stored as instead of potentially a message in the middle
+        with metrics.span('lookup', guild=payload.guild_id):
+            itemId,event = self.lookupTrackedItem(msgId)
+        if event is None:
+            logger.warning('Reaction add: could not find the message in the tracker so ignoring this', extra=log.fields(msgId=msgId))
             return
+        self.freshMessages.discard(itemId)
 
-        # Purge reacts not on the main message if it is an extended message
+        # Purge reacts not on the main message if it is an extended message. Restored items need to
+        # be looked up first to know which message that is
         # TODO: Remove when we depracate extended messages
+        if (msgId != itemId) and (event.saved is not None):
+            event = await self.fetchTrackedItem(itemId)
+            if event is None:
+                return
         if (isinstance(event.msgObj, extmessage.ExtMessage) and (event.msgObj.id != msgId)):
-            print('Tracker Reaction Add: Purged reacts that arent to the last message in a ExtMessage')
+            logger.info('Reaction add: purged reacts that arent to the last message in a ExtMessage', extra=log.fields(itemId=itemId))
             await event.msgObj.clean_reactions()
             return
 
         # Check if the user is already in the list, this should really just be an edge case for the owner
-        for e in event.entries:
-            if (e.user == user) and (e.react == emoji) and (e.valid):
-                return
+        idx,_ = event.findEntry(payload.user_id, emoji)
+        if idx is not None:
+            return
 
         # Add RSVP to the list
-        newEntry = trackerEntry(user, emoji, datetime.utcnow(), True)
-        event.entries.append(newEntry)
-
+        newEntry = trackerEntry(payload.user_id, emoji, time.time(), True)
+        event.addEntry(newEntry)
+        self.journal.append('a', itemId, e=trackerEntry.encode(newEntry))
         # Run any callbacks that the Cog who created the tracker requested
-        if (event.cogOwner is not None) and (event.cogOwner in self.msgCb):
-            await self.msgCb[event.cogOwner](event)
+        if self._entryChanged(event, newEntry):
+            self.requestRender(itemId, event)
 
     '''
     Removes the user from the list of tracked events
     '''
-    @commands.Cog.listener()
-    async def on_raw_reaction_remove(self, payload):
-        # Unpack the parameters
-        uPayload = await self._unpackRawReaction(payload)
-        message  = uPayload.message
-        emoji    = uPayload.emoji
-        user     = uPayload.user
-
-        # Grab the message ID to see if we should even try to parse stuff
-        msgId = message.id
+    async def _reactionRemove(self, payload:disnake.RawReactionActionEvent):
+        # Entries only need the IDs, so nothing has to be looked up
+        msgId = payload.message_id
+        emoji = emojiKey(payload.emoji)
 
         # Run garbage collection so that we don't process expired events
         self.gc()
 
         # Skip modifying anything if we aren't tracking on this message
-        if msgId not in self.trackedItems:
-            print('Tracker Reaction Remove: Could not find {:d} in the tracker so ignoring this'.format(msgId))
+        with metrics.span('lookup', guild=payload.guild_id):
+            itemId,event = self.lookupTrackedItem(msgId)
+        if event is None:
+            logger.warning('Reaction remove: could not find the message in the tracker so ignoring this', extra=log.fields(msgId=msgId))
             return
-        else:
-            event = self.trackedItems[msgId]
-
-        # Look for the user in the list. Since we are tracking all reacts, we need to
-        # compare that it's the same user, emoji, and is the currently active one
-        for e in event.entries:
-            if (e.user == user) and (emoji == e.react) and (e.valid):
-                rsvp = e
-                break
-        else:
+        self.freshMessages.discard(itemId)
+
+        # Reacts that aren't on the main message of an extended message are purged rather than tracked,
+        # so there is nothing to remove
+        # TODO: Remove when we depracate extended messages
+        if itemId != msgId:
+            return
+
+        # Look for the user in the list. Since we are tracking all reacts, we need the
+        # currently active entry for the same user and emoji
+        idx,rsvp = event.findEntry(payload.user_id, emoji)
+        if rsvp is None:
             # Something goofy happened...so we'll just pretend it never happened
-            print('Tracker Reaction Remove: sub-routine failed to find the user who un-reacted.')
+            logger.debug('Reaction remove: failed to find the user who un-reacted', extra=log.fields(itemId=itemId, userId=payload.user_id))
             return
 
         # For auditing's sake, we don't delete entries, only invalidate them
-        rsvp.valid = False
-
+        event.invalidateEntry(idx)
+        self.journal.append('i', itemId, n=idx)
         # Run any callbacks that the Cog who created the tracker requested
-        if (event.cogOwner is not None) and (event.cogOwner in self.msgCb):
-            await self.msgCb[event.cogOwner](event)
+        if self._entryChanged(event, rsvp):
+            self.requestRender(itemId, event)
 
 
     '''
-    An unloading function when things shutdown nicely. We try to save any in flight
-    states we may have so that coming back we will pick up right where we left off.
+    An unloading function when things shutdown nicely. Everything is already in the journal
+    and the snapshot is written by shutdown, so there isn't anything else to save
     '''
     def cog_unload(self):
-        # Saving state is disabled. See explanation in the load_settings function
-        #try:
-        #    with open(self.jsonFileName, 'w+') as f:
-        #        json.dump(self.trackedItems, f, default=Tracker.encode, indent=4)
-        #except Exception as e:
-        #    print('got exception')
-        #    print(e)
-        print('reactTracker unloading')
\ No newline at end of file
+        logger.info('Unloading')